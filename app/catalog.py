@@ -0,0 +1,253 @@
+"""
+Catalog Module
+indexed store of dataset files
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from glob import glob
+from app.config import CATALOG_PATH, DOWNLOAD_FOLDER, FORMATS
+
+
+class Catalog:
+    """
+    SQLite catalog of dataset files:
+    format, size, checksum, row count and timestamps.
+    Lookups go through the primary key index,
+    WAL journal allows concurrent download and convert workers.
+    Use shared() to get the catalog of a path created once per process
+    """
+
+    timeout = 30
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str = CATALOG_PATH):
+        self._path = os.path.abspath(path)
+        self._local = threading.local()
+        self.__create()
+
+    @classmethod
+    def shared(cls, path: str = CATALOG_PATH) -> "Catalog":
+        """
+        Catalog of a path shared within the process
+        """
+        key = os.path.abspath(path)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(key)
+            return cls._instances[key]
+
+    @property
+    def path(self) -> str:
+        """
+        Wrapper
+        """
+        return self._path
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Connection of the current thread and process,
+        opened on first use and kept for following operations,
+        so catalog is safe to use from threads and processes
+        """
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.connection = sqlite3.connect(
+                self.path, timeout=self.timeout
+            )
+            local.connection.row_factory = sqlite3.Row
+            local.pid = os.getpid()
+        return local.connection
+
+    def __create(self) -> None:
+        """
+        Creates catalog tables,
+        existing log.txt files are imported into a new catalog
+        """
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self.connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            created = not connection.execute(
+                "SELECT name FROM sqlite_master"
+                " WHERE type = 'table' AND name = 'files'"
+            ).fetchone()
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " name TEXT PRIMARY KEY,"
+                " format TEXT NOT NULL,"
+                " size INTEGER,"
+                " checksum TEXT,"
+                " rows INTEGER,"
+                " created TEXT NOT NULL,"
+                " updated TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                " link TEXT PRIMARY KEY,"
+                " name TEXT NOT NULL,"
+                " etag TEXT,"
+                " last_modified TEXT,"
+                " size INTEGER,"
+                " checked TEXT NOT NULL,"
+                " pending INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {
+                row["name"]
+                for row in connection.execute("PRAGMA table_info(sources)")
+            }
+            if "pending" not in columns:
+                connection.execute(
+                    "ALTER TABLE sources"
+                    " ADD COLUMN pending INTEGER NOT NULL DEFAULT 0"
+                )
+        if created:
+            self.migrate_logs()
+
+    def get(self, name: str) -> dict:
+        """
+        File record or None
+        """
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM files WHERE name = ?", (name,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_format(self, name: str) -> str:
+        """
+        Stored file format or empty string
+        """
+        record = self.get(name)
+        return record["format"] if record else ""
+
+    def record(self,
+               name: str,
+               file_format: str,
+               size: int = None,
+               checksum: str = None,
+               rows: int = None) -> None:
+        """
+        Inserts or updates a file record,
+        a record without checksum keeps the checksum of the download
+        """
+        file_format = file_format.strip().lower()
+        if file_format not in FORMATS:
+            raise TypeError(f"filetype shall be in {FORMATS}")
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT INTO files"
+                " (name, format, size, checksum, rows, created, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET"
+                " format = excluded.format, size = excluded.size,"
+                " checksum = COALESCE(excluded.checksum, files.checksum),"
+                " rows = excluded.rows,"
+                " updated = excluded.updated",
+                (name, file_format, size, checksum, rows, now, now),
+            )
+
+    def files(self, file_format: str = None) -> list:
+        """
+        All file records, optionally of a format
+        """
+        query = "SELECT * FROM files"
+        params = ()
+        if file_format:
+            query += " WHERE format = ?"
+            params = (file_format,)
+        with self.connect() as connection:
+            return [
+                dict(row)
+                for row in connection.execute(query + " ORDER BY name", params)
+            ]
+
+    def get_source(self, link: str) -> dict:
+        """
+        Remote state of a link or None
+        """
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM sources WHERE link = ?", (link,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def record_source(self,
+                      link: str,
+                      name: str,
+                      etag: str = None,
+                      last_modified: str = None,
+                      size: int = None,
+                      pending: bool = False) -> None:
+        """
+        Inserts or updates remote ETag, Last-Modified and size of a link,
+        pending state is not stored locally yet
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO sources"
+                " (link, name, etag, last_modified, size, checked, pending)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (link, name, etag, last_modified, size, now, int(pending)),
+            )
+
+    def confirm_source(self, link: str) -> None:
+        """
+        Marks remote state of a link as stored locally
+        """
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE sources SET pending = 0 WHERE link = ?", (link,)
+            )
+
+    def touch_source(self, link: str) -> None:
+        """
+        Marks remote state of a link as just revalidated
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE sources SET checked = ? WHERE link = ?", (now, link)
+            )
+
+    def migrate_logs(self, download_folder: str = DOWNLOAD_FOLDER) -> int:
+        """
+        Imports name: format records of per-year log.txt files
+        already catalogued files are kept
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        records = []
+        for log_filename in glob(
+                os.path.join(download_folder, "*", "log.txt")
+        ):
+            with open(log_filename, "r", encoding="utf-8") as file:
+                for line in file:
+                    l_line = line.strip().split(": ")
+                    if len(l_line) == 2 and l_line[1] in FORMATS:
+                        records.append((l_line[0], l_line[1], now, now))
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO files (name, format, created, updated)"
+                " VALUES (?, ?, ?, ?)",
+                records,
+            )
+        if records:
+            print(f"Catalog: imported {len(records)} records from log.txt")
+        return len(records)
+
+    @staticmethod
+    def checksum(filename: str, chunk_size: int = 1024 * 1024) -> str:
+        """
+        MD5 hex digest of a file
+        """
+        md5 = hashlib.md5()
+        with open(filename, "rb") as file:
+            while chunk := file.read(chunk_size):
+                md5.update(chunk)
+        return md5.hexdigest()
@@ -1,8 +1,56 @@
 """
 Config Module
 """
+import os
 
 
 URL = "https://www1.nyc.gov/site/tlc/about/tlc-trip-record-data.page"
 DOWNLOAD_FOLDER = "./records/"
-FORMATS = ["csv", "avro", "parquet"]
+FORMATS = ["csv", "avro", "parquet", "dataset"]
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_SEGMENTS = 4
+SEGMENT_MIN_SIZE = 64 * 1024 * 1024
+PARQUET_ROW_GROUP_SIZE = 1000000
+PARQUET_COMPRESSION = "snappy"
+PARQUET_SORTED = False
+PARQUET_SORTED_ROW_GROUP_SIZE = 128 * 1024
+PARQUET_PAGE_INDEX = False
+PARQUET_BLOOM_FILTER_COLUMNS = []
+PARQUET_BLOOM_FILTER_NDV = 4096
+PARQUET_MEMORY_MAP = True
+COMPACT_TYPES = False
+SCHEMA_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_FILE = os.path.join(SCHEMA_FOLDER, "tlc.GreenTaxi.avsc")
+CSV_ENGINE = "arrow"
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+CONVERT_WORKERS = os.cpu_count() or 1
+AVRO_CODEC = "snappy"
+AVRO_BLOCK_SIZE = 1024 * 1024
+DATASET_FOLDER = "./dataset/"
+ROLLUP_FOLDER = "./rollups/"
+ROLLUPS = True
+PARTITIONED_OUTPUT = True
+QUERY_BACKEND = "arrow"
+QUERY_WORKERS = CONVERT_WORKERS
+CATALOG_PATH = os.path.join(DOWNLOAD_FOLDER, "catalog.sqlite3")
+INCREMENTAL = True
+REVALIDATE_AFTER = 24 * 60 * 60
+PAGE_CACHE_PATH = os.path.join(DOWNLOAD_FOLDER, "page_cache.json")
+FUSED_PIPELINE = False
+STREAM_BLOCK_SIZE = 64 * 1024 * 1024
+TAXI_TYPES = ["yellow", "green", "fhv", "fhvhv"]
+METRICS_LOG_PATH = os.path.join(DOWNLOAD_FOLDER, "metrics.jsonl")
+METRICS_PROMETHEUS_PATH = os.path.join(DOWNLOAD_FOLDER, "metrics.prom")
+HTTP_TIMEOUT = (10, 60)
+HTTP_RETRIES = 5
+HTTP_BACKOFF = 1.0
+HTTP_BACKOFF_MAX = 60
+DOWNLOAD_RETRIES = 5
+VERIFY_CHECKSUM = True
+PIPELINED = False
+PIPELINE_MAX_IN_FLIGHT = 2 * max(DOWNLOAD_WORKERS, CONVERT_WORKERS)
+PIPELINE_MAX_PENDING_BYTES = 8 * 1024 * 1024 * 1024
+PIPELINE_MIN_FREE_BYTES = 2 * 1024 * 1024 * 1024
+QUERY_CACHE = True
+QUERY_CACHE_PATH = os.path.join(DOWNLOAD_FOLDER, "query_cache.sqlite3")
+QUERY_CACHE_MAX_BYTES = 16 * 1024 * 1024
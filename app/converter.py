@@ -1,16 +1,47 @@
 """
 Converter
 """
+import inspect
 import os
+from glob import glob
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from os import listdir
-from os.path import isfile
+from os.path import isdir, isfile
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
 import pyarrow.parquet as pq
 from fastavro import writer, reader
-from fastavro.schema import load_schema
-from fastparquet import write
-from app.config import DOWNLOAD_FOLDER
+from app.config import (
+    DOWNLOAD_FOLDER,
+    PARQUET_ROW_GROUP_SIZE,
+    PARQUET_COMPRESSION,
+    PARQUET_SORTED,
+    PARQUET_SORTED_ROW_GROUP_SIZE,
+    PARQUET_PAGE_INDEX,
+    PARQUET_BLOOM_FILTER_COLUMNS,
+    PARQUET_BLOOM_FILTER_NDV,
+    PARQUET_MEMORY_MAP,
+    COMPACT_TYPES,
+    CSV_ENGINE,
+    CSV_BLOCK_SIZE,
+    CONVERT_WORKERS,
+    AVRO_CODEC,
+    AVRO_BLOCK_SIZE,
+    DATASET_FOLDER,
+    PARTITIONED_OUTPUT,
+    INCREMENTAL,
+    ROLLUPS,
+)
+from app.catalog import Catalog
 from app.logger import Logger
+from app.metrics import METRICS
+from app.rollups import Rollups
+from app import schema
+
+HIVE_DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
 
 
 class Converter:
@@ -18,35 +49,51 @@ class Converter:
     Converter csv, avro, parquet
     """
     chunksize = 1000000
+    record_batch_size = 50000
 
     @property
     def converters(self):
         """
         Wrapper for default cls properties
         """
-        converters = {
-            "VendorID": self.conv_int,
-            "lpep_pickup_datetime": self.conv_str,
-            "lpep_dropoff_datetime": self.conv_str,
-            "store_and_fwd_flag": self.conv_str,
-            "RatecodeID": self.conv_int,
-            "PULocationID": self.conv_int,
-            "DOLocationID": self.conv_int,
-            "passenger_count": self.conv_int,
-            "trip_distance": self.conv_float,
-            "fare_amount": self.conv_float,
-            "extra": self.conv_float,
-            "mta_tax": self.conv_float,
-            "tip_amount": self.conv_float,
-            "tolls_amount": self.conv_float,
-            "ehail_fee": self.conv_float,
-            "improvement_surcharge": self.conv_float,
-            "total_amount": self.conv_float,
-            "payment_type": self.conv_int,
-            "trip_type": self.conv_int,
-            "congestion_surcharge": self.conv_float,
+        return self.get_converters("green")
+
+    @property
+    def parquet_schema(self) -> pa.Schema:
+        """
+        Parquet schema matching converters output
+        """
+        return self.get_parquet_schema("green")
+
+    def get_converters(self, taxi_type: str) -> dict:
+        """
+        Per-cell converters of a taxi type
+        derived from its avro schema
+        """
+        types = {
+            pa.int64(): self.conv_int,
+            pa.float64(): self.conv_float,
+        }
+        return {
+            field.name: types.get(field.type, self.conv_str)
+            for field in schema.get_taxi_schema(taxi_type).arrow_schema(
+                timestamps=False
+            )
         }
-        return converters
+
+    def get_parquet_schema(self, taxi_type: str) -> pa.Schema:
+        """
+        Parquet schema matching converters output of a taxi type
+        """
+        types = {
+            self.conv_int: pa.int64(),
+            self.conv_str: pa.string(),
+            self.conv_float: pa.float64(),
+        }
+        return pa.schema([
+            (name, types[conv])
+            for name, conv in self.get_converters(taxi_type).items()
+        ])
 
     def __init__(self):
         print("Initializing Converter")
@@ -81,22 +128,57 @@ class Converter:
             return 0
         return float(val)
 
-    def csv_to_avro(self, filename: str) -> str:
+    @staticmethod
+    def iter_records(tables, batch_size: int = 10000):
+        """
+        Yields row dicts of arrow tables one by one,
+        only batch_size rows are held as python objects
+        """
+        for table in tables:
+            for batch in table.to_batches(max_chunksize=batch_size):
+                names = batch.schema.names
+                columns = [column.to_pylist() for column in batch.columns]
+                for row in zip(*columns):
+                    yield dict(zip(names, row))
+
+    @METRICS.timed()
+    def csv_to_avro(self,
+                    filename: str,
+                    codec: str = AVRO_CODEC,
+                    block_size: int = AVRO_BLOCK_SIZE,
+                    engine: str = CSV_ENGINE) -> str:
         """
         Convert csv to avro
+        streams records into a single avro container,
+        block_size is the container sync interval in bytes
         """
         self._check_file_exists(filename)
         filename_avro = "." + filename.strip(".").split(".")[0] + ".avro"
-        parsed_schema = load_schema("../tlc.GreenTaxi.avsc")
-        self._reset_file(filename_avro)
-        with pd.read_csv(
-            filename, converters=self.converters, chunksize=self.chunksize
-        ) as d_frame:
-            for chunk in d_frame:
-                records = chunk.to_dict("records")
-                with open(filename_avro, "ab+") as out:
-                    writer(out, parsed_schema, records, codec="snappy")
-        Logger(filename).record_file_type("avro")
+        taxi_schema = schema.get_taxi_schema(self.get_taxi_type(filename))
+        counter = {"rows": 0}
+
+        def counted(tables):
+            """
+            Inner Scope
+            Counts rows of passing tables
+            """
+            for table in tables:
+                counter["rows"] += table.num_rows
+                yield table
+
+        tables = self.iter_csv(
+            filename, self.chunksize, engine, timestamps=False
+        )
+        with self._atomic_output(filename_avro) as tmp_filename, \
+                open(tmp_filename, "wb") as out:
+            writer(
+                out,
+                schema.parsed_avro_schema(taxi_schema.path),
+                self.iter_records(counted(tables)),
+                codec=codec,
+                sync_interval=block_size,
+            )
+        Logger(filename).record_file_type("avro", rows=counter["rows"])
         os.remove(filename)
         return filename_avro
 
@@ -108,48 +190,648 @@ class Converter:
         if not os.path.exists(filename):
             raise FileNotFoundError(filename)
 
+    def iter_csv_pandas(self,
+                        filename: str,
+                        chunksize: int = PARQUET_ROW_GROUP_SIZE,
+                        taxi_type: str = None):
+        """
+        Reads csv chunks through per-cell python converters
+        yields arrow tables
+        """
+        taxi_type = taxi_type or self.get_taxi_type(filename)
+        arrow_schema = self.csv_schema("pandas", taxi_type=taxi_type)
+        with pd.read_csv(
+            filename,
+            converters=self.get_converters(taxi_type),
+            chunksize=chunksize,
+        ) as d_frame:
+            for chunk in d_frame:
+                yield pa.Table.from_pandas(
+                    chunk, schema=arrow_schema, preserve_index=False
+                )
+
+    def iter_csv_arrow(self,
+                       filename: str,
+                       chunksize: int = PARQUET_ROW_GROUP_SIZE,
+                       block_size: int = CSV_BLOCK_SIZE,
+                       timestamps: bool = True,
+                       taxi_type: str = None):
+        """
+        Reads csv with native typed pyarrow parser
+        types and null-fill rules come from avro schema
+        of the taxi type, by default derived from filename,
+        datetimes are parsed as timestamps if requested.
+        Columns missing in older files are filled as nulls.
+        Yields arrow tables of about chunksize rows
+        """
+        arrow_schema = self.csv_schema(
+            "arrow", timestamps, taxi_type or self.get_taxi_type(filename)
+        )
+        reader = pa_csv.open_csv(
+            filename,
+            read_options=pa_csv.ReadOptions(block_size=block_size),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=arrow_schema,
+                include_columns=arrow_schema.names,
+                include_missing_columns=True,
+                strings_can_be_null=False,
+            ),
+        )
+        batches, rows = [], 0
+        for batch in reader:
+            batches.append(batch)
+            rows += batch.num_rows
+            if rows >= chunksize:
+                yield schema.fill_nulls(pa.Table.from_batches(batches))
+                batches, rows = [], 0
+        if batches:
+            yield schema.fill_nulls(pa.Table.from_batches(batches))
+
+    def csv_schema(self,
+                   engine: str = CSV_ENGINE,
+                   timestamps: bool = True,
+                   taxi_type: str = "green") -> pa.Schema:
+        """
+        Arrow schema of tables produced by csv engine
+        """
+        if engine == "arrow":
+            return schema.get_taxi_schema(taxi_type).arrow_schema(timestamps)
+        if engine == "pandas":
+            return self.get_parquet_schema(taxi_type)
+        raise ValueError(f"Unknown csv engine: {engine}")
+
+    def iter_csv(self,
+                 filename: str,
+                 chunksize: int = PARQUET_ROW_GROUP_SIZE,
+                 engine: str = CSV_ENGINE,
+                 timestamps: bool = True,
+                 taxi_type: str = None):
+        """
+        Reads csv chunks as arrow tables
+        with "arrow" or "pandas" engine
+        """
+        if engine == "arrow":
+            return self.iter_csv_arrow(
+                filename, chunksize, timestamps=timestamps, taxi_type=taxi_type
+            )
+        if engine == "pandas":
+            return self.iter_csv_pandas(filename, chunksize, taxi_type)
+        raise ValueError(f"Unknown csv engine: {engine}")
+
+    @staticmethod
+    def get_tmp_path(path: str) -> str:
+        """
+        Hidden temporary path next to path,
+        dataset discovery of pyarrow and spark skips dot files,
+        so partial files are never read as partitions
+        """
+        folder, basename = os.path.split(path)
+        return os.path.join(folder, f".{basename}.tmp")
+
+    @staticmethod
+    @contextmanager
+    def _atomic_output(path: str):
+        """
+        Yields temporary path which replaces path on success,
+        so a failed conversion leaves no partial file
+        """
+        tmp_path = Converter.get_tmp_path(path)
+        try:
+            yield tmp_path
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def write_parquet(table: pa.Table,
+                      path: str,
+                      row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+                      compression: str = PARQUET_COMPRESSION,
+                      sorting_column: str = None) -> None:
+        """
+        Writes a table to a parquet file atomically,
+        sorting_column is recorded when the table is sorted by it
+        """
+        with Converter._atomic_output(path) as tmp_path:
+            pq.write_table(
+                table, tmp_path,
+                row_group_size=row_group_size, compression=compression,
+                **Converter.get_writer_options(
+                    table.schema, sorting_column=sorting_column
+                ),
+            )
+
+    @staticmethod
+    def sort_by_pickup(table: pa.Table) -> pa.Table:
+        """
+        Sorts table by pickup datetime,
+        "YYYY-MM-DD HH:MM:SS" strings sort as the times they hold,
+        so column types are kept
+        """
+        pickup = schema.pickup_column(table.schema)
+        return table.take(
+            pc.sort_indices(table, sort_keys=[(pickup, "ascending")])
+        )
+
+    @staticmethod
+    def write_sorted_parquet(table: pa.Table,
+                             path: str,
+                             compression: str = PARQUET_COMPRESSION) -> None:
+        """
+        Writes a table sorted by pickup datetime
+        in PARQUET_SORTED_ROW_GROUP_SIZE row groups
+        """
+        table = Converter.sort_by_pickup(table)
+        Converter.write_parquet(
+            table, path,
+            row_group_size=PARQUET_SORTED_ROW_GROUP_SIZE,
+            compression=compression,
+            sorting_column=schema.pickup_column(table.schema),
+        )
+
     @staticmethod
-    def _reset_file(path) -> None:
+    def get_writer_options(arrow_schema: pa.Schema,
+                           page_index: bool = PARQUET_PAGE_INDEX,
+                           bloom_filter_columns: list = None,
+                           sorting_column: str = None) -> dict:
         """
-        Reset/create avro file
-        Because in converting to avro
-        appending mode is used
+        Optional ParquetWriter features:
+        page index, bloom filters and sorting columns metadata.
+        Features the installed pyarrow does not support are skipped
         """
-        with open(path, "wb"):
-            pass
+        if bloom_filter_columns is None:
+            bloom_filter_columns = PARQUET_BLOOM_FILTER_COLUMNS
+        supported = inspect.signature(pq.ParquetWriter.__init__).parameters
+        options = {}
+        if page_index and "write_page_index" in supported:
+            options["write_page_index"] = True
+        bloom_filters = {
+            name: {"ndv": PARQUET_BLOOM_FILTER_NDV}
+            for name in bloom_filter_columns
+            if name in arrow_schema.names
+        }
+        if bloom_filters and "bloom_filter_options" in supported:
+            options["bloom_filter_options"] = bloom_filters
+        if sorting_column and "sorting_columns" in supported:
+            options["sorting_columns"] = [pq.SortingColumn(
+                arrow_schema.get_field_index(sorting_column)
+            )]
+        return options
 
-    def csv_to_parquet(self, filename: str) -> str:
+    def read_sorted_csv(self,
+                        filename: str,
+                        engine: str = CSV_ENGINE) -> pa.Table:
+        """
+        Reads whole csv as a table sorted by pickup datetime,
+        datetime columns are cast to timestamps
+        """
+        return self.sort_by_pickup(schema.cast_timestamps(pa.concat_tables(
+            self.iter_csv(filename, self.chunksize, engine)
+        )))
+
+    @staticmethod
+    def iter_compact(tables, taxi_schema: schema.TaxiSchema, savings: dict):
+        """
+        Casts tables to compact types,
+        counts table bytes before and after
+        """
+        for table in tables:
+            savings["before"] += table.nbytes
+            table = schema.compact(table, taxi_schema)
+            savings["after"] += table.nbytes
+            yield table
+
+    @staticmethod
+    def report_savings(filename: str, savings: dict, paths: list) -> None:
+        """
+        Prints memory savings of compact types and output size
+        """
+        megabyte = 1024 * 1024
+        before, after = savings["before"], savings["after"]
+        print(
+            f"{filename}: memory {before / megabyte:.2f}MB"
+            f" -> {after / megabyte:.2f}MB"
+            f" ({100 * (before - after) / (before or 1):.0f}% saved),"
+            f" output {sum(map(os.path.getsize, paths)) / megabyte:.2f}MB"
+        )
+
+    @METRICS.timed()
+    def csv_to_parquet(self,
+                       filename: str,
+                       row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+                       compression: str = PARQUET_COMPRESSION,
+                       engine: str = CSV_ENGINE,
+                       rollups: bool = ROLLUPS,
+                       sort: bool = PARQUET_SORTED,
+                       compact: bool = COMPACT_TYPES) -> str:
         """
         Converts csv to parquet
+        streams csv chunks as row groups of a single parquet file,
+        so memory depends on row_group_size, not on file size.
+        rollups are aggregated from the same chunks.
+        sort writes timestamps sorted by pickup datetime in
+        PARQUET_SORTED_ROW_GROUP_SIZE row groups, so row group
+        min/max statistics skip most of the file on time filters.
+        Sorting reads the whole file into memory.
+        compact writes compact column types and reports savings
         """
+        if sort:
+            return self.csv_to_sorted_parquet(
+                filename, compression=compression,
+                engine=engine, rollups=rollups, compact=compact,
+            )
         self._check_file_exists(filename)
         filename_parquet = "." + filename.strip(".").split(".")[0] + ".parquet"
-        self._reset_file(filename_parquet)
-        d_frame = pd.read_csv(filename, converters=self.converters)
-        d_frame.to_parquet(filename_parquet)
-        Logger(filename).record_file_type("parquet")
+        taxi_type = self.get_taxi_type(filename)
+        taxi_schema = schema.get_taxi_schema(taxi_type)
+        arrow_schema = self.csv_schema(engine, taxi_type=taxi_type)
+        tables = self.iter_csv(filename, row_group_size, engine)
+        savings = {"before": 0, "after": 0}
+        if compact:
+            arrow_schema = schema.compact_schema(arrow_schema, taxi_schema)
+            tables = self.iter_compact(tables, taxi_schema, savings)
+        rollup_store = Rollups("flat")
+        rollup_store.remove(filename)
+        rollup_tables = []
+        rows = 0
+        with self._atomic_output(filename_parquet) as tmp_filename, \
+                pq.ParquetWriter(
+                    tmp_filename, arrow_schema,
+                    compression=compression,
+                    **self.get_writer_options(arrow_schema),
+                ) as parquet_writer:
+            for table in tables:
+                parquet_writer.write_table(
+                    table, row_group_size=row_group_size
+                )
+                rows += table.num_rows
+                if rollups:
+                    rollup_tables.append(Rollups.aggregate(table))
+        if rollups:
+            rollup_store.write(filename, rollup_tables)
+        if compact:
+            self.report_savings(filename, savings, [filename_parquet])
+        Logger(filename).record_file_type("parquet", rows=rows)
+        os.remove(filename)
+        return filename_parquet
+
+    @METRICS.timed()
+    def csv_to_sorted_parquet(
+            self,
+            filename: str,
+            row_group_size: int = PARQUET_SORTED_ROW_GROUP_SIZE,
+            compression: str = PARQUET_COMPRESSION,
+            engine: str = CSV_ENGINE,
+            rollups: bool = ROLLUPS,
+            compact: bool = COMPACT_TYPES) -> str:
+        """
+        Converts csv to parquet sorted by pickup datetime
+        with timestamp datetimes and tuned row groups
+        """
+        self._check_file_exists(filename)
+        filename_parquet = self.change_filename_extension(filename, "parquet")
+        rollup_store = Rollups("flat")
+        rollup_store.remove(filename)
+        table = self.read_sorted_csv(filename, engine)
+        savings = {"before": 0, "after": 0}
+        if compact:
+            table = next(self.iter_compact(
+                [table],
+                schema.get_taxi_schema(self.get_taxi_type(filename)),
+                savings,
+            ))
+        with self._atomic_output(filename_parquet) as tmp_filename:
+            pq.write_table(
+                table, tmp_filename,
+                row_group_size=row_group_size,
+                compression=compression,
+                **self.get_writer_options(
+                    table.schema,
+                    sorting_column=schema.pickup_column(table.schema),
+                ),
+            )
+        if rollups:
+            rollup_store.write(filename, [Rollups.aggregate(table)])
+        if compact:
+            self.report_savings(filename, savings, [filename_parquet])
+        Logger(filename).record_file_type("parquet", rows=table.num_rows)
         os.remove(filename)
         return filename_parquet
 
-    def avro_to_parquet(self, filename: str) -> str:
+    @staticmethod
+    def get_taxi_type(filename: str) -> str:
+        """
+        Taxi type from TLC filename
+        green_tripdata_2021-01.csv -> green
+        """
+        return schema.get_taxi_type(filename)
+
+    @staticmethod
+    def get_partition_folder(dataset_folder: str,
+                             taxi_type: str,
+                             year: int,
+                             month: int) -> str:
+        """
+        Hive-style partition folder
+        taxi_type=green/year=2021/month=01,
+        rows without pickup go to the Hive default partition,
+        which pyarrow and spark read as null year and month
+        """
+        if year is None:
+            year = month = HIVE_DEFAULT_PARTITION
+        else:
+            month = f"{month:02d}"
+        return os.path.join(
+            dataset_folder,
+            f"taxi_type={taxi_type}",
+            f"year={year}",
+            f"month={month}",
+        )
+
+    @staticmethod
+    def get_part_filename(filename: str) -> str:
+        """
+        Partition file name of a source file
+        several sources may share a partition
+        """
+        stem = os.path.basename(filename).split(".")[0]
+        return f"part-{stem}.parquet"
+
+    @staticmethod
+    def get_dataset_parts(filename: str,
+                          dataset_folder: str = DATASET_FOLDER) -> list:
+        """
+        Partition files written from a source file
+        part-<source>.parquet or part-<source>-<block>.parquet
+        """
+        part_filename = Converter.get_part_filename(filename)
+        block_prefix = part_filename[:-len(".parquet")] + "-"
+        return [
+            path
+            for path in glob(os.path.join(
+                dataset_folder, "taxi_type=*", "year=*", "month=*",
+                block_prefix[:-1] + "*.parquet"
+            ))
+            if os.path.basename(path) == part_filename
+            or os.path.basename(path).startswith(block_prefix)
+        ]
+
+    @staticmethod
+    def split_by_month(table: pa.Table):
+        """
+        Splits table by actual pickup year and month,
+        rows with empty or unparsable pickup are split
+        as (None, None) and counted in rows_without_pickup_total
+        """
+        pickup = table[schema.pickup_column(table.schema)]
+        if not pa.types.is_timestamp(pickup.type):
+            pickup = pc.cast(
+                pc.if_else(pc.equal(pickup, ""), None, pickup),
+                schema.TIMESTAMP_TYPE,
+            )
+        keys = pc.add(
+            pc.multiply(pc.year(pickup), 100), pc.month(pickup)
+        )
+        for key in pc.unique(keys).to_pylist():
+            if key is None:
+                part = table.filter(pc.is_null(keys))
+                METRICS.count("rows_without_pickup_total", part.num_rows)
+                print(
+                    f"{part.num_rows} rows without pickup datetime"
+                    f" go to {HIVE_DEFAULT_PARTITION} partition"
+                )
+                yield (None, None), part
+                continue
+            yield divmod(key, 100), table.filter(pc.equal(keys, key))
+
+    @METRICS.timed()
+    def csv_to_dataset(self,
+                       filename: str,
+                       dataset_folder: str = DATASET_FOLDER,
+                       row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+                       compression: str = PARQUET_COMPRESSION,
+                       engine: str = CSV_ENGINE,
+                       rollups: bool = ROLLUPS,
+                       compact: bool = COMPACT_TYPES,
+                       sort: bool = PARQUET_SORTED) -> str:
+        """
+        Converts csv to a Hive-style partitioned parquet dataset
+        taxi_type=<type>/year=<yyyy>/month=<mm>/part-<source>.parquet
+        rows are split by pickup datetime, not by file name,
+        parts of a previous conversion of the source are replaced.
+        Records are normalized to unified columns of all taxi types,
+        rollups are aggregated from written partitions,
+        compact writes compact column types and reports savings.
+        sort writes each month partition sorted by pickup datetime,
+        partitions are held in memory until the whole file is read
+        """
+        self._check_file_exists(filename)
+        taxi_type = self.get_taxi_type(filename)
+        taxi_schema = schema.get_taxi_schema(taxi_type)
+        part_filename = self.get_part_filename(filename)
+        arrow_schema = schema.normalize(
+            self.csv_schema(engine, taxi_type=taxi_type).empty_table(),
+            taxi_schema,
+        ).schema
+        tables = (
+            schema.normalize(table, taxi_schema)
+            for table in self.iter_csv(filename, row_group_size, engine)
+        )
+        savings = {"before": 0, "after": 0}
+        if compact:
+            arrow_schema = schema.compact_schema(arrow_schema, taxi_schema)
+            tables = self.iter_compact(tables, taxi_schema, savings)
+        rollup_store = Rollups("dataset")
+        rollup_store.remove(filename)
+        rollup_tables = []
+        writers = {}
+        months = {}
+        rows = 0
+        try:
+            for table in tables:
+                for (year, month), part in self.split_by_month(table):
+                    rows += part.num_rows
+                    if rollups:
+                        rollup_tables.append(Rollups.aggregate(part))
+                    if sort:
+                        months.setdefault((year, month), []).append(part)
+                        continue
+                    if (year, month) not in writers:
+                        folder = self.get_partition_folder(
+                            dataset_folder, taxi_type, year, month
+                        )
+                        os.makedirs(folder, exist_ok=True)
+                        path = os.path.join(folder, part_filename)
+                        writers[(year, month)] = (pq.ParquetWriter(
+                            self.get_tmp_path(path), arrow_schema,
+                            compression=compression,
+                            **self.get_writer_options(arrow_schema),
+                        ), path)
+                    writers[(year, month)][0].write_table(
+                        part, row_group_size=row_group_size
+                    )
+        except BaseException:
+            for parquet_writer, path in writers.values():
+                parquet_writer.close()
+                os.remove(self.get_tmp_path(path))
+            raise
+        new_parts = []
+        for parquet_writer, path in writers.values():
+            parquet_writer.close()
+            os.replace(self.get_tmp_path(path), path)
+            new_parts.append(path)
+        for (year, month), parts in months.items():
+            folder = self.get_partition_folder(
+                dataset_folder, taxi_type, year, month
+            )
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, part_filename)
+            self.write_sorted_parquet(
+                pa.concat_tables(parts), path, compression
+            )
+            new_parts.append(path)
+        for path in self.get_dataset_parts(filename, dataset_folder):
+            if path not in new_parts:
+                os.remove(path)
+        if rollups:
+            rollup_store.write(filename, rollup_tables)
+        if compact:
+            self.report_savings(filename, savings, new_parts)
+        Logger(filename).record_file_type(
+            "dataset",
+            rows=rows,
+            size=sum(os.path.getsize(path) for path in new_parts),
+        )
+        os.remove(filename)
+        return dataset_folder
+
+    @staticmethod
+    def iter_avro(filename: str, batch_size: int = record_batch_size):
+        """
+        Reads avro records in batches
+        yields arrow tables of batch_size rows,
+        arrow schema comes from avro writer schema
+        """
+        with open(filename, "rb") as file:
+            avro_reader = reader(file)
+            arrow_schema = schema.arrow_schema(
+                avro_reader.writer_schema, timestamps=False
+            )
+            names = arrow_schema.names
+            columns = {name: [] for name in names}
+            rows = 0
+            for record in avro_reader:
+                for name in names:
+                    columns[name].append(record[name])
+                rows += 1
+                if rows == batch_size:
+                    yield pa.Table.from_pydict(columns, schema=arrow_schema)
+                    columns = {name: [] for name in names}
+                    rows = 0
+            if rows:
+                yield pa.Table.from_pydict(columns, schema=arrow_schema)
+
+    @METRICS.timed()
+    def avro_to_parquet(self,
+                        filename: str,
+                        row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+                        compression: str = PARQUET_COMPRESSION,
+                        rollups: bool = ROLLUPS) -> str:
         """
         Converts avro to parquet
+        streams avro record batches as parquet row groups,
+        so memory depends on row_group_size, not on file size.
+        Only record_batch_size records are held as python objects
         """
-        d_frame = self.read_avro(filename)
+        self._check_file_exists(filename)
         parquet_filename = self.change_filename_extension(filename, "parquet")
-        write(parquet_filename, d_frame, compression="snappy")
-        Logger(filename).record_file_type("parquet")
+        rollup_store = Rollups("flat")
+        rollup_store.remove(filename)
+        rollup_tables = []
+        with open(filename, "rb") as file:
+            arrow_schema = schema.arrow_schema(
+                reader(file).writer_schema, timestamps=False
+            )
+        with self._atomic_output(parquet_filename) as tmp_filename, \
+                pq.ParquetWriter(
+                    tmp_filename, arrow_schema, compression=compression
+                ) as parquet_writer:
+            buffered, rows, total_rows = [], 0, 0
+            for table in self.iter_avro(filename):
+                buffered.append(table)
+                rows += table.num_rows
+                total_rows += table.num_rows
+                if rollups:
+                    rollup_tables.append(Rollups.aggregate(table))
+                if rows >= row_group_size:
+                    parquet_writer.write_table(
+                        pa.concat_tables(buffered),
+                        row_group_size=row_group_size,
+                    )
+                    buffered, rows = [], 0
+            if buffered:
+                parquet_writer.write_table(
+                    pa.concat_tables(buffered), row_group_size=row_group_size
+                )
+        if rollups:
+            rollup_store.write(filename, rollup_tables)
+        Logger(filename).record_file_type("parquet", rows=total_rows)
         os.remove(filename)
         return parquet_filename
 
     @staticmethod
-    def read_parquet(filename: str) -> pd.DataFrame:
+    def open_parquet(filename: str,
+                     memory_map: bool = PARQUET_MEMORY_MAP
+                     ) -> pq.ParquetFile:
+        """
+        Parquet reader of a memory-mapped file,
+        pages are read from the shared page cache
+        instead of private read buffers
+        """
+        return pq.ParquetFile(filename, memory_map=memory_map)
+
+    @staticmethod
+    def read_arrow(filename: str,
+                   columns: list = None,
+                   row_groups: list = None,
+                   memory_map: bool = PARQUET_MEMORY_MAP) -> pa.Table:
+        """
+        Selected columns and row groups as an arrow table,
+        all of them by default
+        """
+        parquet_file = Converter.open_parquet(filename, memory_map)
+        if row_groups is None:
+            return parquet_file.read(columns=columns)
+        return parquet_file.read_row_groups(row_groups, columns=columns)
+
+    @staticmethod
+    def iter_parquet(filename: str,
+                     columns: list = None,
+                     row_groups: list = None,
+                     batch_size: int = record_batch_size,
+                     memory_map: bool = PARQUET_MEMORY_MAP):
+        """
+        Record batches of selected columns and row groups,
+        only one batch is decoded at a time
+        """
+        yield from Converter.open_parquet(filename, memory_map).iter_batches(
+            batch_size=batch_size, row_groups=row_groups, columns=columns
+        )
+
+    @staticmethod
+    def read_parquet(filename: str,
+                     columns: list = None,
+                     row_groups: list = None) -> pd.DataFrame:
         """
         Read Parquet
+        selected columns and row groups converted to pandas,
+        split blocks keep numeric columns without nulls zero-copy
         """
-        table = pq.read_table(filename)
-        d_frame = table.to_pandas()
-        return d_frame
+        return Converter.read_arrow(filename, columns, row_groups).to_pandas(
+            split_blocks=True
+        )
 
     @staticmethod
     def read_avro(filename: str) -> pd.DataFrame:
@@ -162,19 +844,85 @@ class Converter:
             df_avro = pd.DataFrame(avro_records)
             return df_avro
 
-    def convert_all(self) -> None:
+    def convert_all(self,
+                    workers: int = CONVERT_WORKERS,
+                    partitioned: bool = PARTITIONED_OUTPUT,
+                    incremental: bool = INCREMENTAL) -> list:
         """
         Pipeline
         converts all downloaded to parquet
+        or to partitioned parquet dataset.
+        workers > 1 converts files in a process pool.
+        A failed file does not stop the batch,
+        failed filenames are returned.
+        incremental takes pending csv files from catalog
+        instead of scanning download folders
         """
-        all_files = self._get_all_csv()
+        convert = self.csv_to_dataset if partitioned else self.csv_to_parquet
+        all_files = (
+            self._get_pending_csv() if incremental else self._get_all_csv()
+        )
         if not (len_files := len(all_files)):
             print("No files to convert")
-            return
+            return []
         print("Converting files")
-        for i, file in enumerate(all_files, 1):
-            print(f"{i}/{len_files}) {file}")
-            self.csv_to_parquet(file)
+        failed = []
+        if workers > 1:
+            with ProcessPoolExecutor(
+                    max_workers=min(workers, len_files)
+            ) as executor:
+                futures = {
+                    executor.submit(convert, file): file
+                    for file in all_files
+                }
+                for i, future in enumerate(as_completed(futures), 1):
+                    file = futures[future]
+                    if error := future.exception():
+                        failed.append(file)
+                        print(f"{i}/{len_files}) {file} failed: {error}")
+                    else:
+                        self._count_converted(file)
+                        print(f"{i}/{len_files}) {file}")
+        else:
+            for i, file in enumerate(all_files, 1):
+                print(f"{i}/{len_files}) {file}")
+                try:
+                    convert(file)
+                    self._count_converted(file)
+                except Exception as error:  # pylint: disable=broad-except
+                    failed.append(file)
+                    print(f"{file} failed: {error}")
+        METRICS.count(
+            "files_total", len(failed), stage="convert", status="failed"
+        )
+        if failed:
+            print(f"{len(failed)}/{len_files} files failed to convert")
+        return failed
+
+    @staticmethod
+    def _count_converted(filename: str) -> None:
+        """
+        Counts a converted file and its catalogued rows,
+        so rows of worker processes are counted too
+        """
+        record = Logger(filename).get_file_record() or {}
+        METRICS.count("files_total", stage="convert", status="ok")
+        METRICS.count(
+            "rows_processed_total", record.get("rows") or 0,
+            format=record.get("format"),
+        )
+
+    @staticmethod
+    def _get_pending_csv() -> list:
+        """
+        Downloaded csv filenames[paths] recorded in catalog
+        """
+        print("Collecting pending csv filenames")
+        return [
+            filename
+            for record in Catalog.shared().files("csv")
+            if isfile((filename := record["name"] + ".csv"))
+        ]
 
     @staticmethod
     def _get_all_csv(download_folder: str = DOWNLOAD_FOLDER) -> list:
@@ -191,7 +939,10 @@ class Converter:
             return "/".join([base, file])
 
         folders = listdir(download_folder)
-        folders = ["".join([download_folder, f]) for f in folders]
+        folders = [
+            folder for f in folders
+            if isdir((folder := "".join([download_folder, f])))
+        ]
         return [
             full_file
             for folder in folders
@@ -218,5 +969,6 @@ def run() -> None:
     Data pipeline for
     Converter
     """
-    converter = Converter()
-    converter.convert_all()
+    with METRICS.stage("convert"):
+        converter = Converter()
+        converter.convert_all()
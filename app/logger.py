@@ -2,20 +2,21 @@
 Logger Module
 """
 import os
-from app.config import FORMATS
+from app.catalog import Catalog
 
 
 class Logger:
     """
     Logger to keep track of actual file format
+    records are kept in the Catalog
     """
 
     def __init__(self, filename: str, record: str = ""):
         self._filename = self._get_filename_no_extension(filename)
-        self._log_filename = self._get_log_filename(filename)
+        self._catalog = Catalog.shared()
         self._record = record
         if record:
-            self.append_log(record)
+            self.record_file_type(record)
 
     @property
     def log_exists(self) -> bool:
@@ -31,19 +32,12 @@ class Logger:
         """
         return self._filename
 
-    @property
-    def log_filename(self) -> str:
-        """
-        Wrapper
-        """
-        return self._log_filename
-
     @property
     def record(self) -> str:
         """
         Wrapper
         """
-        return self.record
+        return self._record
 
     @staticmethod
     def _get_filename_no_extension(filename: str) -> str:
@@ -52,80 +46,44 @@ class Logger:
         """
         return "." + filename.strip(".").split(".")[0]
 
-    @staticmethod
-    def _get_log_filename(filename: str) -> str:
+    def _log_exists(self) -> bool:
         """
-        Get filename for log file
+        Checks if a file record exists
         """
-        return "/".join(filename.split("/")[:-1] + ["log.txt"])
+        return self._catalog.get(self.filename) is not None
 
-    def _log_exists(self) -> bool:
+    def _get_size(self, filetype: str) -> int:
         """
-        Checks if a log exists
-        Wrapper
+        Size of stored file
         """
-        if os.path.exists(self.log_filename):
-            return True
-        return False
+        path = self.filename + "." + filetype
+        return os.path.getsize(path) if os.path.exists(path) else None
 
     def get_file_format(self) -> str:
         """
         Gets storage format from a record
         """
-        if self._log_exists():
-            with open(self.log_filename, "r", encoding='utf-8') as file:
-                for line in file:
-                    l_line = line.strip().split(": ")
-                    if l_line[0] == self.filename:
-                        return l_line[1]
-        return ""
+        return self._catalog.get_format(self.filename)
 
-    def record_file_type(self, filetype: str) -> None:
+    def get_file_record(self) -> dict:
         """
-        Record stored file type to log
+        Gets full catalog record
         """
-        filetype = filetype.strip().lower()
-        if filetype not in FORMATS:
-            raise TypeError(f"filetype shall be in {FORMATS}")
-        if self._log_exists():
-            with open(self.log_filename, "r", encoding='utf-') as file:
-                content = file.readlines()
-            file_record_found = False
-            for i, line in enumerate(content):
-                l_line = line.strip().split(": ")
-                if l_line[0] == self.filename:
-                    content[i] = l_line[0] + ": " + filetype
-                    self.write_log(content)
-                    file_record_found = True
-                    break
-            if not file_record_found:
-                record = self.filename + ": " + filetype
-                self.append_log(record)
-        else:
-            content = self.filename + ": " + filetype
-            self.write_log(content)
-
-    def append_log(self, record: [str, list]) -> None:
-        """
-        Appending log
-        """
-        if not self._log_exists():
-            self.write_log(record)
-        else:
-            with open(self.log_filename, "a", encoding='utf-8') as file:
-                if isinstance(record, list):
-                    for line in record:
-                        file.write(line + "\n")
-                else:
-                    file.write(record + "\n")
+        return self._catalog.get(self.filename)
 
-    def write_log(self, record: [str, list]) -> None:
+    def record_file_type(self,
+                         filetype: str,
+                         rows: int = None,
+                         checksum: str = None,
+                         size: int = None) -> None:
         """
-        Overwriting Log
+        Record stored file type, size,
+        row count and checksum to catalog
+        size defaults to size of the stored file
         """
-        with open(self.log_filename, "w", encoding='utf-8') as file:
-            if isinstance(record, list):
-                for line in record:
-                    file.write(line + "\n")
-            else:
-                file.write(record + "\n")
+        filetype = filetype.strip().lower()
+        self._catalog.record(
+            self.filename, filetype,
+            size=size or self._get_size(filetype),
+            checksum=checksum, rows=rows,
+        )
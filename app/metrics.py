@@ -0,0 +1,268 @@
+"""
+Metrics Module
+per-stage timing and counters,
+exported as JSON lines and Prometheus text
+"""
+import contextvars
+import functools
+import json
+import os
+import resource
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+from typing import Callable
+from app.config import METRICS_LOG_PATH, METRICS_PROMETHEUS_PATH
+
+PREFIX = "tlc_"
+SCOPES = contextvars.ContextVar("metrics_scopes", default=())
+HELP = {
+    "stage_duration_seconds": "Duration of pipeline stages",
+    "stage_duration_max_seconds": "Longest run of pipeline stages",
+    "bytes_downloaded_total": "Bytes received from the TLC server",
+    "rows_processed_total": "Rows written by conversions",
+    "rows_without_pickup_total": "Rows written without pickup datetime",
+    "files_total": "Files processed by stage and status",
+    "retries_total": "Retried HTTP requests",
+    "query_cache_total": "Query results found in or missing from cache",
+    "peak_rss_bytes": "Peak resident memory of process and its children",
+}
+
+
+def escape_label(value) -> str:
+    """
+    Escapes a Prometheus label value
+    """
+    return (
+        str(value).replace("\\", "\\\\")
+        .replace("\"", "\\\"").replace("\n", "\\n")
+    )
+
+
+def peak_rss_bytes() -> int:
+    """
+    Peak resident memory of this process
+    and of its finished child processes
+    """
+    return 1024 * max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and stage durations.
+    Stages are logged as JSON lines when they end,
+    so stages of worker processes are logged too,
+    counters of the registry belong to this process.
+    A stage counts only what is counted in its context,
+    so concurrent per-file stages do not see each other
+    """
+
+    def __init__(self,
+                 log_path: str = METRICS_LOG_PATH,
+                 prometheus_path: str = METRICS_PROMETHEUS_PATH):
+        self.log_path = log_path
+        self.prometheus_path = prometheus_path
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._stages = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        """
+        Registry key of a metric with labels
+        """
+        return name, tuple(sorted(labels.items()))
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Increments a counter
+        and counters of stages running in this context
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            for scope in SCOPES.get():
+                scope[key] = scope.get(key, 0) + value
+
+    @staticmethod
+    def bind(func: Callable) -> Callable:
+        """
+        Runs func in a copy of this context,
+        so counts of a task submitted to a thread pool
+        go to the stages which submitted it
+        """
+        return functools.partial(contextvars.copy_context().run, func)
+
+    def get(self, name: str, **labels) -> float:
+        """
+        Counter value
+        """
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def snapshot(self) -> dict:
+        """
+        Copy of all counters
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Registers a stage duration
+        """
+        with self._lock:
+            count, total, longest = self._stages.get(stage, (0, 0.0, 0.0))
+            self._stages[stage] = (
+                count + 1, total + seconds, max(longest, seconds)
+            )
+
+    def log(self, event: str, **fields) -> None:
+        """
+        Appends a structured JSON line to metrics log
+        """
+        record = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "event": event,
+            "pid": os.getpid(),
+            **fields,
+        }
+        folder = os.path.dirname(self.log_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self._lock, open(self.log_path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(record, default=str) + "\n")
+
+    @contextmanager
+    def stage(self, name: str, **fields):
+        """
+        Times a stage and logs its duration, status,
+        peak memory and counters changed during it
+        in its context and in tasks bound to it
+        """
+        scope = {}
+        token = SCOPES.set(SCOPES.get() + (scope,))
+        start = perf_counter()
+        status = "error"
+        try:
+            yield
+            status = "ok"
+        finally:
+            seconds = perf_counter() - start
+            SCOPES.reset(token)
+            self.observe(name, seconds)
+            counters = {}
+            with self._lock:
+                scope = dict(scope)
+            for (metric, labels), value in scope.items():
+                if value:
+                    label = ",".join(f"{k}={v}" for k, v in labels)
+                    counters[f"{metric}{{{label}}}" if label else metric] = (
+                        value
+                    )
+            self.log(
+                "stage",
+                stage=name,
+                status=status,
+                seconds=round(seconds, 6),
+                peak_rss_bytes=peak_rss_bytes(),
+                counters=counters,
+                **fields,
+            )
+
+    def timed(self, name: str = None) -> Callable:
+        """
+        Decorator timing every call as a stage,
+        return value is preserved.
+        First string argument (file or link) is logged as target
+        """
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def inner(*args, **kwargs):
+                target = next(
+                    (arg for arg in args if isinstance(arg, str)), None
+                )
+                with self.stage(name or func.__qualname__, target=target):
+                    return func(*args, **kwargs)
+
+            return inner
+
+        return decorator
+
+    def to_prometheus(self) -> str:
+        """
+        Prometheus text exposition of registry
+        """
+        lines = []
+        typed = set()
+
+        def header(metric: str, metric_type: str) -> None:
+            """
+            Inner Scope
+            HELP and TYPE lines once per metric
+            """
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(
+                    f"# HELP {PREFIX}{metric} {HELP.get(metric, '')}"
+                )
+                lines.append(f"# TYPE {PREFIX}{metric} {metric_type}")
+
+        def labels_text(labels) -> str:
+            """
+            Inner Scope
+            {name="value",...}
+            """
+            if not labels:
+                return ""
+            return "{" + ",".join(
+                f'{name}="{escape_label(value)}"' for name, value in labels
+            ) + "}"
+
+        with self._lock:
+            stages = dict(self._stages)
+            counters = dict(self._counters)
+        for stage, (count, total, _) in sorted(stages.items()):
+            header("stage_duration_seconds", "summary")
+            label = labels_text([("stage", stage)])
+            lines.append(
+                f"{PREFIX}stage_duration_seconds_sum{label} {total}"
+            )
+            lines.append(
+                f"{PREFIX}stage_duration_seconds_count{label} {count}"
+            )
+        for stage, (_, _, longest) in sorted(stages.items()):
+            header("stage_duration_max_seconds", "gauge")
+            label = labels_text([("stage", stage)])
+            lines.append(
+                f"{PREFIX}stage_duration_max_seconds{label} {longest}"
+            )
+        for (metric, labels), value in sorted(
+                counters.items(), key=lambda item: repr(item[0])
+        ):
+            header(metric, "counter")
+            lines.append(f"{PREFIX}{metric}{labels_text(labels)} {value}")
+        header("peak_rss_bytes", "gauge")
+        lines.append(f"{PREFIX}peak_rss_bytes {peak_rss_bytes()}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str = None) -> str:
+        """
+        Writes Prometheus text file atomically,
+        e.g. for node_exporter textfile collector
+        """
+        path = path or self.prometheus_path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        os.replace(path + ".tmp", path)
+        return path
+
+
+METRICS = Metrics()
@@ -0,0 +1,206 @@
+"""
+Pipeline Module
+overlapped download, conversion and query stages
+"""
+import multiprocessing
+import os
+import queue
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from app.config import (
+    URL,
+    DOWNLOAD_FOLDER,
+    DOWNLOAD_WORKERS,
+    DOWNLOAD_SEGMENTS,
+    CONVERT_WORKERS,
+    PARTITIONED_OUTPUT,
+    INCREMENTAL,
+    PIPELINE_MAX_IN_FLIGHT,
+    PIPELINE_MAX_PENDING_BYTES,
+    PIPELINE_MIN_FREE_BYTES,
+)
+from app.converter import Converter
+from app.logger import Logger
+from app.metrics import METRICS
+from app.queries import Queries
+from app.scrapper import Scrapper, Downloader, BYPASS_LINK
+from app.utils import Progress
+
+
+class Pipeline:
+    """
+    Scheduler of overlapped stages:
+    each finished download is queued to a conversion process pool,
+    each converted file is registered with queries as it lands,
+    so wall-clock time approaches the one of the slowest stage.
+    Backpressure: files downloading, waiting or converting
+    are bounded by max_in_flight, new downloads wait while
+    downloaded csv bytes not yet converted exceed max_pending_bytes
+    or free disk space is below min_free_bytes.
+    One file is always let through, so the pipeline cannot stall
+    """
+
+    def __init__(self,
+                 queries: Queries = None,
+                 download_workers: int = DOWNLOAD_WORKERS,
+                 convert_workers: int = CONVERT_WORKERS,
+                 max_in_flight: int = PIPELINE_MAX_IN_FLIGHT,
+                 max_pending_bytes: int = PIPELINE_MAX_PENDING_BYTES,
+                 min_free_bytes: int = PIPELINE_MIN_FREE_BYTES,
+                 partitioned: bool = PARTITIONED_OUTPUT,
+                 incremental: bool = INCREMENTAL):
+        self.queries = queries
+        self.download_workers = download_workers
+        self.convert_workers = convert_workers
+        self.max_in_flight = max_in_flight
+        self.max_pending_bytes = max_pending_bytes
+        self.min_free_bytes = min_free_bytes
+        self.partitioned = partitioned
+        self.incremental = incremental
+        self.converter = Converter()
+        self._events = queue.Queue()
+        self._in_flight = 0
+        self._pending_bytes = 0
+        self.failed = []
+
+    @staticmethod
+    def get_jobs(links: dict) -> list:
+        """
+        (link, year) pairs of links from Scrapper
+        """
+        return [(link, year) for year in links for link in links[year]]
+
+    def has_capacity(self) -> bool:
+        """
+        Checks backpressure limits before a new download
+        """
+        if not self._in_flight:
+            return True
+        if self._in_flight >= self.max_in_flight:
+            return False
+        if self._pending_bytes >= self.max_pending_bytes:
+            return False
+        os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+        return shutil.disk_usage(DOWNLOAD_FOLDER).free >= self.min_free_bytes
+
+    def __notify(self, kind: str, item):
+        """
+        Future callback putting a finished task to events queue,
+        events are handled by the scheduling thread only
+        """
+        def callback(future) -> None:
+            self._events.put((kind, item, future))
+
+        return callback
+
+    def __fail(self, stage: str, name: str, error: Exception) -> None:
+        """
+        Records a failed link or file, the batch goes on
+        """
+        self.failed.append(name)
+        METRICS.count("files_total", stage=stage, status="failed")
+        print(f"\n{name} failed to {stage}: {error}")
+
+    def __on_downloaded(self, link: str, future, converter) -> None:
+        """
+        Queues a downloaded csv to conversion
+        """
+        if error := future.exception():
+            self._in_flight -= 1
+            self.__fail("download", link, error)
+            return
+        filename = future.result()
+        record = Logger(filename).get_file_record() or {}
+        if record.get("format") != "csv" or not os.path.isfile(filename):
+            self._in_flight -= 1
+            return
+        size = os.path.getsize(filename)
+        self._pending_bytes += size
+        converter.submit(self.convert, filename).add_done_callback(
+            self.__notify("converted", (filename, size))
+        )
+
+    def __on_converted(self, item: tuple, future) -> None:
+        """
+        Registers a converted file with queries
+        """
+        filename, size = item
+        self._in_flight -= 1
+        self._pending_bytes -= size
+        if error := future.exception():
+            self.__fail("convert", filename, error)
+            return
+        # pylint: disable=protected-access
+        Converter._count_converted(filename)
+        print(f"\nConverted {filename}")
+        if self.queries is not None:
+            self.queries.register(filename)
+
+    @property
+    def convert(self):
+        """
+        Conversion of a csv file in a worker process
+        """
+        if self.partitioned:
+            return self.converter.csv_to_dataset
+        return self.converter.csv_to_parquet
+
+    def run(self, links: dict) -> list:
+        """
+        Downloads, converts and registers all links,
+        failed links and filenames are returned.
+        Conversion workers are spawned,
+        forking a process with running download threads is unsafe
+        """
+        jobs = deque(self.get_jobs(links))
+        total = len(jobs)
+        progress = Progress()
+        Downloader.get_session(self.download_workers * DOWNLOAD_SEGMENTS)
+        with ThreadPoolExecutor(
+                max_workers=self.download_workers
+        ) as downloader, ProcessPoolExecutor(
+            max_workers=self.convert_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as converter:
+            while jobs or self._in_flight:
+                while jobs and self.has_capacity():
+                    link, year = jobs.popleft()
+                    self._in_flight += 1
+                    downloader.submit(
+                        METRICS.bind(Downloader.download_link), link, year,
+                        [total - len(jobs), total], progress,
+                        self.incremental, False,
+                    ).add_done_callback(self.__notify("downloaded", link))
+                kind, item, future = self._events.get()
+                if kind == "downloaded":
+                    self.__on_downloaded(item, future, converter)
+                else:
+                    self.__on_converted(item, future)
+        print("")
+        if self.failed:
+            print(f"{len(self.failed)}/{total} files failed")
+        return self.failed
+
+
+def run(url: str = URL,
+        bypass: bool = False,
+        queries: Queries = None) -> list:
+    """
+    Data pipeline of overlapped
+    Scrapper, Converter and Queries
+    """
+    with METRICS.stage("scrape"):
+        links = Scrapper(url).get_links()
+    if bypass:
+        print("Bypassing download of all files")
+        links = {2021: [BYPASS_LINK]}
+    with METRICS.stage("pipeline"):
+        failed = Pipeline(queries).run(links)
+    if queries is not None:
+        with METRICS.stage(
+                "query", taxi_type=queries.taxi_type,
+                years=f"{queries.first_year}-{queries.last_year}",
+        ):
+            queries.report()
+    return failed
@@ -0,0 +1,753 @@
+"""
+Queries Module
+analytics over all converted files
+for a range of years and a taxi type
+
+Usage:
+    python -m app.queries --years 2019 2021 --taxi-type green
+"""
+import argparse
+import functools
+from abc import ABC, abstractmethod
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from typing import Callable
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+from app.config import (
+    DATASET_FOLDER,
+    DOWNLOAD_FOLDER,
+    PARTITIONED_OUTPUT,
+    PARQUET_MEMORY_MAP,
+    QUERY_BACKEND,
+    QUERY_CACHE,
+    QUERY_WORKERS,
+    ROLLUPS,
+)
+from app import schema
+from app.metrics import METRICS
+from app.query_cache import QueryCache
+from app.rollups import Rollups
+
+REPORTS = ["average", "hours", "weekday"]
+COLUMN_TYPES = [schema.TIMESTAMP_TYPE, pa.float64(), pa.int64()]
+MISSING = object()
+
+
+def cached(query: str, restore: Callable = None) -> Callable:
+    """
+    Decorator of a query method,
+    result is taken from query cache while input files are unchanged.
+    restore rebuilds tuples of a JSON result
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def inner(self, *args, **kwargs):
+            if self.cache is None:
+                return func(self, *args, **kwargs)
+            description = self.describe(query, *args, **kwargs)
+            key = self.cache.make_key(
+                description, self.cache.fingerprint(self.get_input_files())
+            )
+            if (result := self.cache.get(key, MISSING)) is not MISSING:
+                METRICS.count("query_cache_total", status="hit")
+                return restore(result) if restore else result
+            METRICS.count("query_cache_total", status="miss")
+            result = func(self, *args, **kwargs)
+            self.cache.put(key, description, result)
+            return result
+
+        return inner
+
+    return decorator
+
+
+def restore_pairs(rows: list) -> list:
+    """
+    [[key, value], ...] -> [(key, value), ...]
+    """
+    return [tuple(row) for row in rows]
+
+
+def restore_pair(row: list) -> tuple:
+    """
+    [key, value] -> (key, value)
+    """
+    return tuple(row) if row is not None else None
+
+
+class Queries(ABC):
+    """
+    Average trip distance, busiest hours and
+    weekday with the lowest number of single rider trips
+    read only pickup, trip_distance and passenger_count columns.
+    Dataset records have unified columns of all taxi types,
+    taxi_type "all" queries them together.
+    Backends implement the three queries,
+    results are cached until input files change
+    """
+
+    year_pattern = re.compile(r"year=(\d+)")
+
+    def __init__(self,
+                 first_year: int,
+                 last_year: int,
+                 taxi_type: str = "green",
+                 partitioned: bool = PARTITIONED_OUTPUT,
+                 cache: bool = QUERY_CACHE):
+        self.first_year = first_year
+        self.last_year = last_year
+        self.taxi_type = taxi_type
+        self.partitioned = partitioned
+        self.pickup = self.get_pickup_column(taxi_type, partitioned)
+        self.cache = QueryCache() if cache else None
+
+    @staticmethod
+    def get_pickup_column(taxi_type: str, partitioned: bool) -> str:
+        """
+        Unified pickup column of the dataset
+        or source pickup column of flat files
+        """
+        if partitioned:
+            if taxi_type != "all":
+                schema.get_taxi_schema(taxi_type)
+            return "pickup_datetime"
+        if taxi_type == "all":
+            raise ValueError("Flat files are queried by a single taxi type")
+        return schema.get_taxi_schema(taxi_type).pickup
+
+    @property
+    def columns(self) -> list:
+        """
+        Projected columns
+        """
+        return [self.pickup, "trip_distance", "passenger_count"]
+
+    def get_files(self) -> list:
+        """
+        Flat per-file parquet records of selected years
+        """
+        files = sorted(
+            file
+            for year in range(self.first_year, self.last_year + 1)
+            for file in glob(os.path.join(
+                DOWNLOAD_FOLDER, str(year),
+                f"{self.taxi_type}_tripdata_*.parquet"
+            ))
+        )
+        if not files:
+            raise FileNotFoundError(
+                f"No {self.taxi_type} records for"
+                f" {self.first_year}-{self.last_year}"
+            )
+        return files
+
+    def get_input_files(self) -> list:
+        """
+        Parquet files a query reads
+        """
+        if not self.partitioned:
+            return self.get_files()
+        taxi_type = "*" if self.taxi_type == "all" else self.taxi_type
+        return sorted(
+            file
+            for file in glob(os.path.join(
+                DATASET_FOLDER, f"taxi_type={taxi_type}",
+                "year=*", "month=*", "*.parquet",
+            ))
+            if (year := self.year_pattern.search(file))
+            and self.first_year <= int(year.group(1)) <= self.last_year
+        )
+
+    def describe(self, query: str, *args, **kwargs) -> str:
+        """
+        Query text of a cached result:
+        backend, query, its arguments and selected records
+        """
+        return " ".join([
+            type(self).__name__,
+            query,
+            repr(args),
+            repr(sorted(kwargs.items())),
+            self.taxi_type,
+            f"{self.first_year}-{self.last_year}",
+            "dataset" if self.partitioned else "flat",
+        ])
+
+    @abstractmethod
+    def average_trip_distance(self) -> float:
+        """
+        Average Trip Distance
+        """
+
+    @abstractmethod
+    def busiest_hours(self, limit: int = 3) -> list:
+        """
+        Busiest Hours
+        [(hour, trips), ...]
+        """
+
+    @abstractmethod
+    def lowest_single_rider_weekday(self) -> tuple:
+        """
+        Day of week with the lowest number of single rider trips
+        (day, trips), day 1 is Sunday
+        """
+
+    def register(self, filename: str) -> None:
+        """
+        Takes a source converted after the queries were created,
+        backends aggregating in process aggregate it as it lands
+        """
+
+    def report(self, reports: list = None) -> None:
+        """
+        Prints selected reports
+        """
+        reports = reports or REPORTS
+        print(
+            f"{self.taxi_type} taxi records"
+            f" {self.first_year}-{self.last_year}"
+        )
+        if "average" in reports:
+            print(f"Average trip distance: {self.average_trip_distance()}")
+        if "hours" in reports:
+            print("Busiest hours:")
+            for hour, trips in self.busiest_hours():
+                print(f"  {hour}h: {trips} trips")
+        if "weekday" in reports:
+            if weekday := self.lowest_single_rider_weekday():
+                print(
+                    f"Lowest single rider trips day of week:"
+                    f" {weekday[0]} ({weekday[1]} trips)"
+                )
+
+
+class SparkQueries(Queries):
+    """
+    PySpark SQL backend for large clusters
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._data = None
+
+    @property
+    def spark(self):
+        """
+        Wrapper
+        session timezone is UTC, so hours of naive parquet
+        timestamps and of datetime strings are the same
+        """
+        # pylint: disable=import-outside-toplevel
+        from pyspark.sql import SparkSession
+
+        return (
+            SparkSession.builder.appName("TLC queries")
+            .config("spark.sql.session.timeZone", "UTC")
+            .enableHiveSupport()
+            .getOrCreate()
+        )
+
+    @property
+    def data(self):
+        """
+        Selected records as one spark DataFrame
+        partition filters prune the dataset to selected years,
+        schemas of taxi types are merged
+        """
+        # pylint: disable=import-outside-toplevel
+        from pyspark.sql.functions import col
+
+        if self._data is None:
+            if self.partitioned:
+                data = self.spark.read.option(
+                    "mergeSchema", "true"
+                ).parquet(DATASET_FOLDER).where(
+                    (col("year") >= self.first_year)
+                    & (col("year") <= self.last_year)
+                )
+                if self.taxi_type != "all":
+                    data = data.where(col("taxi_type") == self.taxi_type)
+            else:
+                data = self.spark.read.parquet(*self.get_files())
+            self._data = data.select(*self.columns)
+        return self._data
+
+    def sql(self, query: str) -> list:
+        """
+        Runs SQL over selected records
+        registered as trips view
+        """
+        self.data.createOrReplaceTempView("trips")
+        return self.spark.sql(query).collect()
+
+    @cached("average")
+    def average_trip_distance(self) -> float:
+        return self.sql(
+            "SELECT avg(trip_distance) AS average FROM trips"
+        )[0]["average"]
+
+    @cached("hours", restore_pairs)
+    def busiest_hours(self, limit: int = 3) -> list:
+        rows = self.sql(
+            f"SELECT hour(timestamp({self.pickup})) AS hour,"
+            " COUNT(*) as occurance FROM trips"
+            f" GROUP BY hour ORDER BY occurance DESC LIMIT {int(limit)}"
+        )
+        return [(row["hour"], row["occurance"]) for row in rows]
+
+    @cached("weekday", restore_pair)
+    def lowest_single_rider_weekday(self) -> tuple:
+        rows = self.sql(
+            f"SELECT dayofweek(timestamp({self.pickup})) AS day,"
+            " COUNT(*) as occurance FROM trips"
+            " WHERE passenger_count = 1 GROUP BY day"
+            " ORDER BY occurance ASC LIMIT 1"
+        )
+        return (rows[0]["day"], rows[0]["occurance"]) if rows else None
+
+
+class ArrowQueries(Queries):
+    """
+    In-process pyarrow compute backend, no JVM needed.
+    Files are memory-mapped unless memory_map is False.
+    All three queries are aggregated in a single streaming pass
+    over record batches, results match SparkQueries.
+    Sources with rollups are aggregated from rollups,
+    only sources without them are scanned
+    """
+
+    def __init__(self,
+                 *args,
+                 rollups: bool = ROLLUPS,
+                 memory_map: bool = PARQUET_MEMORY_MAP,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rollups = rollups
+        self.memory_map = memory_map
+        self._aggregates = None
+        self._sources = set()
+        self._complete = False
+
+    def get_fragments(self) -> list:
+        """
+        Parquet fragments of selected records
+        partition filters prune the dataset to selected years,
+        memory-mapped files share the page cache between processes
+        """
+        filesystem = fs.LocalFileSystem(use_mmap=self.memory_map)
+        if self.partitioned:
+            dataset = ds.dataset(
+                os.path.abspath(DATASET_FOLDER),
+                partitioning="hive",
+                filesystem=filesystem,
+            )
+            expression = (
+                (ds.field("year") >= self.first_year)
+                & (ds.field("year") <= self.last_year)
+            )
+            if self.taxi_type != "all":
+                expression &= ds.field("taxi_type") == self.taxi_type
+            return list(dataset.get_fragments(filter=expression))
+        return list(ds.dataset(
+            [os.path.abspath(file) for file in self.get_files()],
+            filesystem=filesystem,
+        ).get_fragments())
+
+    def iter_batches(self, fragments: list = None):
+        """
+        Projected record batches of selected records
+        read file by file, so files may differ in pickup type
+        """
+        if fragments is None:
+            fragments = self.get_fragments()
+        for fragment in fragments:
+            present = self.get_present_columns(
+                fragment.physical_schema.names, self.columns
+            )
+            for batch in fragment.to_batches(columns=present):
+                yield self.fill_missing_columns(batch, self.columns)
+
+    @staticmethod
+    def get_present_columns(names: list, columns: list) -> list:
+        """
+        Projected columns which a file has,
+        flat fhv and fhvhv files have no trip_distance or passenger_count
+        """
+        return [column for column in columns if column in names]
+
+    @staticmethod
+    def fill_missing_columns(batch: pa.RecordBatch,
+                             columns: list) -> pa.RecordBatch:
+        """
+        Batch of pickup, trip_distance and passenger_count columns,
+        columns missing in the file are null as in a dataset scan
+        """
+        names = batch.schema.names
+        return pa.RecordBatch.from_arrays(
+            [
+                batch.column(names.index(column)) if column in names
+                else pa.nulls(batch.num_rows, column_type)
+                for column, column_type in zip(columns, COLUMN_TYPES)
+            ],
+            names=columns,
+        )
+
+    @staticmethod
+    def to_timestamps(pickup: pa.Array) -> pa.Array:
+        """
+        Casts pickup datetime strings to timestamps,
+        empty strings become null as in spark timestamp()
+        """
+        if pa.types.is_timestamp(pickup.type):
+            return pickup
+        return pc.cast(
+            pc.if_else(pc.equal(pickup, ""), None, pickup),
+            schema.TIMESTAMP_TYPE,
+        )
+
+    @staticmethod
+    def count_values(counts: dict, values: pa.Array) -> None:
+        """
+        Accumulates value counts, null is a value as in GROUP BY
+        """
+        for item in pc.value_counts(values).to_pylist():
+            counts[item["values"]] = (
+                counts.get(item["values"], 0) + item["counts"]
+            )
+
+    @staticmethod
+    def sum_values(counts: dict, rollup: pa.Table, key: str, value: str):
+        """
+        Accumulates rollup sums of a value by key,
+        zero sums are not a group as in GROUP BY of filtered rows
+        """
+        grouped = rollup.group_by(key).aggregate([(value, "sum")])
+        for item, total in zip(
+                grouped[key].to_pylist(), grouped[value + "_sum"].to_pylist()
+        ):
+            if total:
+                counts[item] = counts.get(item, 0) + total
+
+    def add_rollup(self, aggregates: dict, rollup: pa.Table) -> None:
+        """
+        Accumulates aggregates of rollups
+        """
+        aggregates["distance_sum"] += (
+            pc.sum(rollup["distance_sum"]).as_py() or 0
+        )
+        aggregates["distance_count"] += (
+            pc.sum(rollup["distance_count"]).as_py() or 0
+        )
+        self.sum_values(aggregates["hours"], rollup, "hour", "trips")
+        self.sum_values(
+            aggregates["weekdays"], rollup, "weekday", "single_rider_trips"
+        )
+
+    @property
+    def rollup_store(self) -> Rollups:
+        """
+        Rollups of queried layout
+        """
+        return Rollups("dataset" if self.partitioned else "flat")
+
+    def get_rollup_sources(self, fragments: list) -> list:
+        """
+        Sources of fragments which have rollups
+        """
+        if not self.rollups:
+            return []
+        rollups = self.rollup_store
+        return sorted(
+            stem
+            for stem in {
+                Rollups.get_source_stem(fragment.path)
+                for fragment in fragments
+            }
+            if rollups.exists(stem)
+        )
+
+    @property
+    def aggregates(self) -> dict:
+        """
+        Distance sum and count, trips per hour and
+        single rider trips per day of week
+        """
+        if not self._complete:
+            self.aggregate_fragments(self.get_fragments())
+            self._complete = True
+        return self._aggregates
+
+    def register(self, filename: str) -> None:
+        """
+        Aggregates fragments of a converted source as it lands,
+        so reports only aggregate the remaining sources.
+        A source is aggregated once
+        """
+        stem = Rollups.get_source_stem(filename)
+        try:
+            fragments = self.get_fragments()
+        except FileNotFoundError:
+            return
+        self.aggregate_fragments([
+            fragment for fragment in fragments
+            if Rollups.get_source_stem(fragment.path) == stem
+        ])
+
+    def aggregate_fragments(self, fragments: list) -> None:
+        """
+        Accumulates aggregates of fragments of sources
+        not aggregated yet
+        """
+        if self._aggregates is None:
+            self._aggregates = self.new_aggregates()
+        aggregates = self._aggregates
+        fragments = [
+            fragment for fragment in fragments
+            if Rollups.get_source_stem(fragment.path) not in self._sources
+        ]
+        self._sources.update(
+            Rollups.get_source_stem(fragment.path) for fragment in fragments
+        )
+        if sources := self.get_rollup_sources(fragments):
+            self.add_rollup(aggregates, self.rollup_store.read(
+                sources, *(
+                    (self.first_year, self.last_year)
+                    if self.partitioned else ()
+                )
+            ))
+            fragments = [
+                fragment for fragment in fragments
+                if Rollups.get_source_stem(fragment.path) not in sources
+            ]
+        self.scan_fragments(aggregates, fragments)
+
+    def scan_fragments(self, aggregates: dict, fragments: list) -> None:
+        """
+        Accumulates aggregates of record batches of fragments
+        """
+        for batch in self.iter_batches(fragments):
+            self.add_batch(aggregates, batch)
+
+    @staticmethod
+    def new_aggregates() -> dict:
+        """
+        Empty aggregates
+        """
+        return {
+            "distance_sum": 0.0,
+            "distance_count": 0,
+            "hours": {},
+            "weekdays": {},
+        }
+
+    @staticmethod
+    def add_batch(aggregates: dict, batch: pa.RecordBatch) -> None:
+        """
+        Accumulates aggregates of a batch of
+        pickup, trip_distance and passenger_count columns
+        """
+        pickup = ArrowQueries.to_timestamps(batch.column(0))
+        distance = pc.cast(batch.column(1), pa.float64())
+        if valid := len(distance) - distance.null_count:
+            aggregates["distance_sum"] += pc.sum(distance).as_py()
+            aggregates["distance_count"] += valid
+        ArrowQueries.count_values(aggregates["hours"], pc.hour(pickup))
+        single = pc.equal(batch.column(2), 1)
+        ArrowQueries.count_values(
+            aggregates["weekdays"],
+            pc.day_of_week(
+                pc.filter(pickup, single),
+                count_from_zero=False,
+                week_start=7,
+            ),
+        )
+
+    @staticmethod
+    def merge_aggregates(aggregates: dict, partial: dict) -> None:
+        """
+        Accumulates partial aggregates
+        """
+        aggregates["distance_sum"] += partial["distance_sum"]
+        aggregates["distance_count"] += partial["distance_count"]
+        for key in ("hours", "weekdays"):
+            for value, count in partial[key].items():
+                aggregates[key][value] = aggregates[key].get(value, 0) + count
+
+    @cached("average")
+    def average_trip_distance(self) -> float:
+        aggregates = self.aggregates
+        if not aggregates["distance_count"]:
+            return None
+        return aggregates["distance_sum"] / aggregates["distance_count"]
+
+    @cached("hours", restore_pairs)
+    def busiest_hours(self, limit: int = 3) -> list:
+        return sorted(
+            self.aggregates["hours"].items(),
+            key=lambda item: (-item[1], item[0] is None, item[0]),
+        )[:limit]
+
+    @cached("weekday", restore_pair)
+    def lowest_single_rider_weekday(self) -> tuple:
+        weekdays = self.aggregates["weekdays"]
+        if not weekdays:
+            return None
+        return min(
+            weekdays.items(),
+            key=lambda item: (item[1], item[0] is None, item[0]),
+        )
+
+
+def aggregate_shard(path: str,
+                    row_groups: list,
+                    columns: list,
+                    memory_map: bool = PARQUET_MEMORY_MAP) -> dict:
+    """
+    Partial aggregates of row groups of a parquet file,
+    runs in a worker process
+    """
+    parquet_file = pq.ParquetFile(path, memory_map=memory_map)
+    present = ArrowQueries.get_present_columns(
+        parquet_file.schema_arrow.names, columns
+    )
+    aggregates = ArrowQueries.new_aggregates()
+    for batch in parquet_file.iter_batches(
+            row_groups=row_groups, columns=present
+    ):
+        ArrowQueries.add_batch(
+            aggregates, ArrowQueries.fill_missing_columns(batch, columns)
+        )
+    return aggregates
+
+
+class ShardedQueries(ArrowQueries):
+    """
+    Map-reduce variant of ArrowQueries:
+    scanned files are split into shards of row groups,
+    partial aggregates of shards are computed in a process pool
+    and merged, results are the same as of ArrowQueries
+    """
+
+    def __init__(self, *args, workers: int = QUERY_WORKERS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workers = workers
+
+    @staticmethod
+    def get_shards(path: str, row_groups_per_shard: int = 1) -> list:
+        """
+        Row group lists of a parquet file
+        """
+        count = pq.ParquetFile(path).metadata.num_row_groups
+        return [
+            list(range(start, min(start + row_groups_per_shard, count)))
+            for start in range(0, count, row_groups_per_shard)
+        ]
+
+    def register(self, filename: str) -> None:
+        """
+        Aggregates a landed source in this process,
+        sources land next to download threads
+        and forking a process with running threads is unsafe
+        """
+        workers, self.workers = self.workers, 1
+        try:
+            super().register(filename)
+        finally:
+            self.workers = workers
+
+    def scan_fragments(self, aggregates: dict, fragments: list) -> None:
+        shards = [
+            (fragment.path, row_groups)
+            for fragment in fragments
+            for row_groups in self.get_shards(fragment.path)
+        ]
+        if self.workers < 2 or len(shards) < 2:
+            for path, row_groups in shards:
+                self.merge_aggregates(aggregates, aggregate_shard(
+                    path, row_groups, self.columns, self.memory_map
+                ))
+            return
+        with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(shards))
+        ) as executor:
+            futures = [
+                executor.submit(
+                    aggregate_shard,
+                    path, row_groups, self.columns, self.memory_map,
+                )
+                for path, row_groups in shards
+            ]
+            for future in as_completed(futures):
+                self.merge_aggregates(aggregates, future.result())
+
+
+BACKENDS = {
+    "arrow": ArrowQueries,
+    "sharded": ShardedQueries,
+    "spark": SparkQueries,
+}
+
+
+def get_queries(first_year: int,
+                last_year: int = None,
+                taxi_type: str = "green",
+                backend: str = QUERY_BACKEND) -> Queries:
+    """
+    Queries of selected backend
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend shall be in {sorted(BACKENDS)}")
+    return BACKENDS[backend](first_year, last_year or first_year, taxi_type)
+
+
+def run(first_year: int,
+        last_year: int = None,
+        taxi_type: str = "green",
+        reports: list = None,
+        backend: str = QUERY_BACKEND) -> None:
+    """
+    Data pipeline for
+    Queries
+    """
+    with METRICS.stage(
+            "query", taxi_type=taxi_type, backend=backend,
+            years=f"{first_year}-{last_year or first_year}",
+    ):
+        get_queries(first_year, last_year, taxi_type, backend).report(reports)
+
+
+def main() -> None:
+    """
+    Command line interface
+    """
+    parser = argparse.ArgumentParser(description="TLC trip records reports")
+    parser.add_argument(
+        "--years", nargs=2, type=int, required=True,
+        metavar=("FIRST", "LAST"),
+    )
+    parser.add_argument(
+        "--taxi-type", default="green",
+        choices=sorted(schema.TAXI_SCHEMAS) + ["all"],
+    )
+    parser.add_argument(
+        "--report", action="append", choices=REPORTS, dest="reports"
+    )
+    parser.add_argument(
+        "--backend", default=QUERY_BACKEND, choices=sorted(BACKENDS)
+    )
+    args = parser.parse_args()
+    run(
+        args.years[0], args.years[1], args.taxi_type,
+        args.reports, args.backend
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Query Cache Module
+persistent store of query results
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from app.config import QUERY_CACHE_PATH, QUERY_CACHE_MAX_BYTES
+
+
+class QueryCache:
+    """
+    SQLite store of query results keyed by query
+    and a fingerprint of its input files: paths, sizes and mtimes.
+    A result of changed files is never found,
+    it is replaced by the next result of the same query.
+    Least recently used results are evicted above max_bytes
+    """
+
+    timeout = 30
+
+    def __init__(self,
+                 path: str = QUERY_CACHE_PATH,
+                 max_bytes: int = QUERY_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.__create()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        New connection, one per operation
+        """
+        return sqlite3.connect(self.path, timeout=self.timeout)
+
+    def __create(self) -> None:
+        """
+        Creates results table
+        """
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with closing(self.connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " query TEXT NOT NULL,"
+                " result TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_query ON results (query)"
+            )
+
+    @staticmethod
+    def fingerprint(paths: list) -> str:
+        """
+        Digest of paths, sizes and modification times of files
+        """
+        digest = hashlib.sha256()
+        for path in sorted(paths):
+            stat = os.stat(path)
+            digest.update(
+                f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode()
+            )
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(query: str, fingerprint: str) -> str:
+        """
+        Cache key of a query over a version of files
+        """
+        return hashlib.sha256(f"{query}\0{fingerprint}".encode()).hexdigest()
+
+    def get(self, key: str, default=None):
+        """
+        Cached result or default,
+        a found result becomes the most recently used
+        """
+        with closing(self.connect()) as connection, connection:
+            row = connection.execute(
+                "SELECT result FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return default
+            connection.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?",
+                (time.time(), key),
+            )
+        return json.loads(row[0])
+
+    def put(self, key: str, query: str, result) -> None:
+        """
+        Stores a JSON serializable result,
+        replaces results of the query over other file versions
+        """
+        text = json.dumps(result)
+        with closing(self.connect()) as connection, connection:
+            connection.execute(
+                "DELETE FROM results WHERE query = ? AND key != ?",
+                (query, key),
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO results"
+                " (key, query, result, size, accessed)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, query, text, len(text), time.time()),
+            )
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Removes least recently used results above max_bytes,
+        returns number of removed results
+        """
+        with closing(self.connect()) as connection, connection:
+            total = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            keys = []
+            for key, size in connection.execute(
+                    "SELECT key, size FROM results ORDER BY accessed"
+            ):
+                if total <= self.max_bytes:
+                    break
+                keys.append((key,))
+                total -= size
+            connection.executemany("DELETE FROM results WHERE key = ?", keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        """
+        Removes all results
+        """
+        with closing(self.connect()) as connection, connection:
+            connection.execute("DELETE FROM results")
@@ -0,0 +1,184 @@
+"""
+Rollups Module
+precomputed per hour aggregates of converted files
+"""
+import os
+import re
+from datetime import date, timedelta
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from app.config import ROLLUP_FOLDER
+from app import schema
+
+ROLLUP_SCHEMA = pa.schema([
+    pa.field("date", pa.date32()),
+    pa.field("year", pa.int32()),
+    pa.field("hour", pa.int32()),
+    pa.field("weekday", pa.int32()),
+    pa.field("trips", pa.int64()),
+    pa.field("single_rider_trips", pa.int64()),
+    pa.field("distance_sum", pa.float64()),
+    pa.field("distance_count", pa.int64()),
+])
+KEYS = ["date", "year", "hour", "weekday"]
+MEASURES = ["trips", "single_rider_trips", "distance_sum", "distance_count"]
+
+
+class Rollups:
+    """
+    Per source file rollups of trips by pickup date and hour:
+    trip count, single rider trip count, trip distance sum and count.
+    Reports are computed from rollups in O(days) instead of O(trips).
+    A source rollup is replaced when the source is converted again,
+    so a new month only adds its own rollup file.
+    layout separates rollups of the dataset and of flat files
+    """
+
+    part_pattern = re.compile(r"^part-(.+?)(-\d{5})?\.parquet$")
+
+    def __init__(self, layout: str = "dataset", folder: str = ROLLUP_FOLDER):
+        self.folder = os.path.join(folder, layout)
+
+    @staticmethod
+    def get_source_stem(path: str) -> str:
+        """
+        Source file stem of a dataset part or a flat file
+        part-green_tripdata_2021-01-00003.parquet -> green_tripdata_2021-01
+        """
+        basename = os.path.basename(path)
+        if match := Rollups.part_pattern.match(basename):
+            return match.group(1)
+        return basename.split(".")[0]
+
+    def get_filename(self, stem: str) -> str:
+        """
+        Rollup file of a source
+        """
+        return os.path.join(self.folder, stem + ".parquet")
+
+    def exists(self, stem: str) -> bool:
+        """
+        Checks if a source has a rollup
+        """
+        return os.path.exists(self.get_filename(stem))
+
+    def remove(self, filename: str) -> None:
+        """
+        Removes rollup of a source before it is converted again,
+        so an interrupted conversion leaves no stale rollup
+        """
+        path = self.get_filename(self.get_source_stem(filename))
+        if os.path.exists(path):
+            os.remove(path)
+
+    @staticmethod
+    def aggregate(table: pa.Table) -> pa.Table:
+        """
+        Rollup of a table of trips,
+        rows without pickup are one group with null date and hour
+        """
+        pickup = table[schema.pickup_column(table.schema)]
+        if not pa.types.is_timestamp(pickup.type):
+            pickup = pc.if_else(pc.equal(pickup, ""), None, pickup)
+        hours = pc.divide(pc.cast(
+            pc.cast(pickup, schema.TIMESTAMP_TYPE, safe=False), pa.int64()
+        ), 3600)
+        names = table.schema.names
+        passengers = (
+            table["passenger_count"] if "passenger_count" in names
+            else pa.nulls(table.num_rows, pa.int64())
+        )
+        distance = (
+            pc.cast(table["trip_distance"], pa.float64())
+            if "trip_distance" in names
+            else pa.nulls(table.num_rows, pa.float64())
+        )
+        grouped = pa.table({
+            "hours": hours,
+            "single": pc.cast(pc.equal(passengers, 1), pa.int64()),
+            "distance": distance,
+        }).group_by("hours").aggregate([
+            ("hours", "count", pc.CountOptions(mode="all")),
+            ("single", "sum"),
+            ("distance", "sum"),
+            ("distance", "count"),
+        ])
+        keys = {name: [] for name in KEYS}
+        for hours_since_epoch in grouped["hours"].to_pylist():
+            if hours_since_epoch is None:
+                for name in KEYS:
+                    keys[name].append(None)
+                continue
+            days, hour = divmod(hours_since_epoch, 24)
+            day = date(1970, 1, 1) + timedelta(days=days)
+            keys["date"].append(day)
+            keys["year"].append(day.year)
+            keys["hour"].append(hour)
+            keys["weekday"].append(day.isoweekday() % 7 + 1)
+        return pa.Table.from_arrays(
+            [pa.array(keys[name], ROLLUP_SCHEMA.field(name).type)
+             for name in KEYS]
+            + [
+                grouped["hours_count"],
+                pc.fill_null(grouped["single_sum"], 0),
+                pc.fill_null(grouped["distance_sum"], 0.0),
+                grouped["distance_count"],
+            ],
+            schema=ROLLUP_SCHEMA,
+        )
+
+    @staticmethod
+    def merge(tables: list) -> pa.Table:
+        """
+        Merges rollups of chunks into a single rollup
+        """
+        if not tables:
+            return ROLLUP_SCHEMA.empty_table()
+        grouped = pa.concat_tables(tables).group_by(KEYS).aggregate(
+            [(name, "sum") for name in MEASURES]
+        )
+        return pa.Table.from_arrays(
+            [grouped[name] for name in KEYS]
+            + [grouped[name + "_sum"] for name in MEASURES],
+            schema=ROLLUP_SCHEMA,
+        )
+
+    def write(self, filename: str, tables: list) -> str:
+        """
+        Writes merged rollup of a source atomically
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.get_filename(self.get_source_stem(filename))
+        pq.write_table(self.merge(tables), path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return path
+
+    def write_from_parts(self, filename: str, parts: list) -> str:
+        """
+        Rollup of a source from its written parquet files
+        """
+        columns = ["pickup_datetime", "passenger_count", "trip_distance"]
+        return self.write(filename, [
+            self.aggregate(pq.read_table(path, columns=columns))
+            for path in parts
+        ])
+
+    def read(self,
+             stems: list,
+             first_year: int = None,
+             last_year: int = None) -> pa.Table:
+        """
+        Rollups of sources, optionally of pickup years
+        """
+        tables = [pq.read_table(self.get_filename(stem)) for stem in stems]
+        rollup = (
+            pa.concat_tables(tables) if tables
+            else ROLLUP_SCHEMA.empty_table()
+        )
+        if first_year is not None:
+            rollup = rollup.filter(pc.and_(
+                pc.greater_equal(rollup["year"], first_year),
+                pc.less_equal(rollup["year"], last_year),
+            ))
+        return rollup
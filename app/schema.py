@@ -0,0 +1,298 @@
+"""
+Schema Module
+Avro schema driven typing for csv parsing
+and registry of per taxi type schemas
+"""
+import json
+import os
+from dataclasses import dataclass, field as dataclass_field
+from functools import lru_cache
+import pyarrow as pa
+import pyarrow.compute as pc
+from fastavro.schema import load_schema
+from app.config import SCHEMA_FILE, SCHEMA_FOLDER
+
+AVRO_TO_ARROW = {
+    "int": pa.int64(),
+    "long": pa.int64(),
+    "float": pa.float64(),
+    "double": pa.float64(),
+    "string": pa.string(),
+}
+TIMESTAMP_TYPE = pa.timestamp("s")
+COMPACT_INT_TYPES = {
+    "VendorID": pa.int8(),
+    "RatecodeID": pa.int8(),
+    "passenger_count": pa.int8(),
+    "payment_type": pa.int8(),
+    "trip_type": pa.int8(),
+    "SR_Flag": pa.int8(),
+    "PULocationID": pa.int16(),
+    "DOLocationID": pa.int16(),
+}
+DICTIONARY_COLUMNS = [
+    "store_and_fwd_flag",
+    "hvfhs_license_num",
+    "dispatching_base_num",
+    "Affiliated_base_number",
+]
+
+
+def load_avro_schema(path: str = SCHEMA_FILE) -> dict:
+    """
+    Loads avro schema json
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+@lru_cache(maxsize=None)
+def parsed_avro_schema(path: str = SCHEMA_FILE) -> dict:
+    """
+    Parsed avro schema for fastavro writers
+    parsed once per process
+    """
+    return load_schema(path)
+
+
+def is_datetime_field(field: dict) -> bool:
+    """
+    Checks if an avro field holds date and time
+    """
+    return isinstance(field["type"], dict) and "logicalType" in field["type"]
+
+
+def arrow_schema(avro_schema: dict = None,
+                 timestamps: bool = True) -> pa.Schema:
+    """
+    Makes arrow schema from avro schema
+    datetime fields become timestamps if requested
+    """
+    avro_schema = avro_schema or load_avro_schema()
+    fields = []
+    for field in avro_schema["fields"]:
+        if is_datetime_field(field):
+            arrow_type = TIMESTAMP_TYPE if timestamps else pa.string()
+        else:
+            avro_type = field["type"]
+            if isinstance(avro_type, dict):
+                avro_type = avro_type["type"]
+            arrow_type = AVRO_TO_ARROW[avro_type]
+        fields.append(pa.field(field["name"], arrow_type))
+    return pa.schema(fields)
+
+
+def pickup_column(arrow_schema: pa.Schema) -> str:
+    """
+    Pickup datetime column name
+    lpep_pickup_datetime, tpep_pickup_datetime, ...
+    """
+    for name in arrow_schema.names:
+        if name.lower().endswith("pickup_datetime"):
+            return name
+    raise KeyError("Schema has no pickup datetime column")
+
+
+UNIFIED_SCHEMA = pa.schema([
+    pa.field("pickup_datetime", TIMESTAMP_TYPE),
+    pa.field("dropoff_datetime", TIMESTAMP_TYPE),
+    pa.field("PULocationID", pa.int64()),
+    pa.field("DOLocationID", pa.int64()),
+    pa.field("passenger_count", pa.int64()),
+    pa.field("trip_distance", pa.float64()),
+])
+
+
+@dataclass(frozen=True)
+class TaxiSchema:
+    """
+    Schema of a taxi type records
+    renames map source columns to unified analytical columns
+    """
+    taxi_type: str
+    schema_file: str
+    renames: dict = dataclass_field(default_factory=dict)
+
+    @property
+    def path(self) -> str:
+        """
+        Avro schema file path
+        """
+        return os.path.join(SCHEMA_FOLDER, self.schema_file)
+
+    @property
+    def pickup(self) -> str:
+        """
+        Source pickup datetime column
+        """
+        return pickup_column(self.arrow_schema(timestamps=False))
+
+    def avro_schema(self) -> dict:
+        """
+        Avro schema json
+        """
+        return load_avro_schema(self.path)
+
+    def arrow_schema(self, timestamps: bool = True) -> pa.Schema:
+        """
+        Arrow schema of source columns
+        """
+        return arrow_schema(self.avro_schema(), timestamps)
+
+    def normalized_schema(self) -> pa.Schema:
+        """
+        Arrow schema of normalized records:
+        unified columns first, other source columns after them
+        """
+        return normalize(self.arrow_schema().empty_table(), self).schema
+
+
+TAXI_SCHEMAS = {
+    "yellow": TaxiSchema("yellow", "tlc.YellowTaxi.avsc", {
+        "tpep_pickup_datetime": "pickup_datetime",
+        "tpep_dropoff_datetime": "dropoff_datetime",
+    }),
+    "green": TaxiSchema("green", "tlc.GreenTaxi.avsc", {
+        "lpep_pickup_datetime": "pickup_datetime",
+        "lpep_dropoff_datetime": "dropoff_datetime",
+    }),
+    "fhv": TaxiSchema("fhv", "tlc.Fhv.avsc", {
+        "dropOff_datetime": "dropoff_datetime",
+        "PUlocationID": "PULocationID",
+        "DOlocationID": "DOLocationID",
+    }),
+    "fhvhv": TaxiSchema("fhvhv", "tlc.FhvHv.avsc"),
+}
+
+
+def get_taxi_type(filename: str) -> str:
+    """
+    Taxi type from TLC filename
+    green_tripdata_2021-01.csv -> green
+    """
+    return os.path.basename(filename).split("_tripdata")[0]
+
+
+def get_taxi_schema(taxi_type: str) -> TaxiSchema:
+    """
+    Registered schema of a taxi type
+    """
+    if taxi_type not in TAXI_SCHEMAS:
+        raise ValueError(
+            f"Unknown taxi type: {taxi_type},"
+            f" shall be in {sorted(TAXI_SCHEMAS)}"
+        )
+    return TAXI_SCHEMAS[taxi_type]
+
+
+def normalize(table: pa.Table, taxi_schema: TaxiSchema) -> pa.Table:
+    """
+    Normalizes records to unified analytical schema:
+    common columns are renamed and cast to unified types,
+    missing ones are added as nulls, other columns are kept
+    """
+    table = table.rename_columns([
+        taxi_schema.renames.get(name, name) for name in table.schema.names
+    ])
+    columns, fields = [], []
+    for unified in UNIFIED_SCHEMA:
+        if unified.name in table.schema.names:
+            column = table[unified.name]
+            if pa.types.is_timestamp(unified.type):
+                column = to_timestamps(column)
+            column = pc.cast(column, unified.type)
+        else:
+            column = pa.nulls(table.num_rows, unified.type)
+        columns.append(column)
+        fields.append(unified)
+    for name in table.schema.names:
+        if name not in UNIFIED_SCHEMA.names:
+            columns.append(table[name])
+            fields.append(table.schema.field(name))
+    return pa.Table.from_arrays(columns, schema=pa.schema(fields))
+
+
+def to_timestamps(column: pa.Array) -> pa.Array:
+    """
+    Casts datetime strings to timestamps,
+    empty strings become null
+    """
+    if pa.types.is_timestamp(column.type):
+        return column
+    return pc.cast(
+        pc.if_else(pc.equal(column, ""), None, column), TIMESTAMP_TYPE
+    )
+
+
+def cast_timestamps(table: pa.Table) -> pa.Table:
+    """
+    Casts all datetime string columns of a table to timestamps
+    """
+    for i, name in enumerate(table.schema.names):
+        if name.lower().endswith("_datetime"):
+            table = table.set_column(
+                i, name, to_timestamps(table.column(i))
+            )
+    return table
+
+
+def compact_schema(arrow_schema: pa.Schema,
+                   taxi_schema: "TaxiSchema") -> pa.Schema:
+    """
+    Compact types of a schema:
+    int8/int16 for small integer codes and location ids,
+    float32 where avro schema says float,
+    dictionary encoding for low cardinality string columns
+    """
+    floats = {
+        taxi_schema.renames.get(field["name"], field["name"])
+        for field in taxi_schema.avro_schema()["fields"]
+        if field["type"] == "float"
+    }
+    fields = []
+    for field in arrow_schema:
+        arrow_type = field.type
+        if field.name in COMPACT_INT_TYPES:
+            arrow_type = COMPACT_INT_TYPES[field.name]
+        elif field.name in floats:
+            arrow_type = pa.float32()
+        elif (field.name in DICTIONARY_COLUMNS
+              and pa.types.is_string(field.type)):
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        fields.append(pa.field(field.name, arrow_type))
+    return pa.schema(fields)
+
+
+def compact(table: pa.Table, taxi_schema: "TaxiSchema") -> pa.Table:
+    """
+    Casts table to compact types,
+    values out of a compact type range raise ArrowInvalid
+    """
+    target = compact_schema(table.schema, taxi_schema)
+    columns = []
+    for column, field in zip(table.columns, target):
+        if column.type == field.type:
+            columns.append(column)
+        elif pa.types.is_dictionary(field.type):
+            columns.append(pc.dictionary_encode(column))
+        else:
+            columns.append(pc.cast(column, field.type))
+    return pa.Table.from_arrays(columns, schema=target)
+
+
+def fill_nulls(batch: [pa.RecordBatch, pa.Table]) -> pa.Table:
+    """
+    Null-fill rules of converters:
+    empty numbers become 0, empty strings become ""
+    timestamps are kept null
+    """
+    columns = []
+    for column, field in zip(batch.columns, batch.schema):
+        if pa.types.is_integer(field.type) or pa.types.is_floating(
+                field.type
+        ):
+            column = pc.fill_null(column, pa.scalar(0, field.type))
+        elif pa.types.is_string(field.type):
+            column = pc.fill_null(column, "")
+        columns.append(column)
+    return pa.Table.from_arrays(columns, schema=batch.schema)
@@ -1,13 +1,64 @@
 """
 Module for scrapping a website
 """
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Dict
+import json
 import os
+import re
+import threading
+import time
 import requests
 from bs4 import BeautifulSoup
+from app.catalog import Catalog
 from app.logger import Logger
 from app.converter import Converter
-from app.config import FORMATS, URL, DOWNLOAD_FOLDER
+from app.metrics import METRICS
+from app.streaming import StreamConverter
+from app.utils import Progress
+from app import transport
+from app.config import (
+    FORMATS,
+    URL,
+    DOWNLOAD_FOLDER,
+    DOWNLOAD_WORKERS,
+    DOWNLOAD_SEGMENTS,
+    SEGMENT_MIN_SIZE,
+    INCREMENTAL,
+    REVALIDATE_AFTER,
+    PAGE_CACHE_PATH,
+    FUSED_PIPELINE,
+    TAXI_TYPES,
+    DOWNLOAD_RETRIES,
+    VERIFY_CHECKSUM,
+)
+
+BYPASS_LINK = (
+    "https://s3.amazonaws.com/nyc-tlc/trip+data/green_tripdata_2021-01.csv"
+)
+LINK_TITLES = {
+    "Yellow Taxi Trip Records": "yellow",
+    "Green Taxi Trip Records": "green",
+    "For-Hire Vehicle Trip Records": "fhv",
+    "High Volume For-Hire Vehicle Trip Records": "fhvhv",
+}
+
+
+@dataclass(frozen=True)
+class TripLink:
+    """
+    Download link of a monthly trip records file
+    """
+    year: int
+    taxi_type: str
+    month: int
+    url: str
+
+
+# year -> taxi type -> month -> link
+LinkIndex = Dict[int, Dict[str, Dict[int, TripLink]]]
 
 
 class Scrapper:
@@ -15,10 +66,17 @@ class Scrapper:
     Scrapper for NY TLC Datasets
     """
 
-    def __init__(self, url: str, years: int = 3):
+    year_id_pattern = re.compile(r"^faq(\d{4})$")
+    month_pattern = re.compile(r"_(\d{4})-(\d{2})\.\w+$")
+
+    def __init__(self,
+                 url: str,
+                 years: int = 3,
+                 cache_path: str = PAGE_CACHE_PATH):
         print("Initializing Scrapper")
         self._url = url
-        self.soup = self.__get_soup_html()
+        self._cache_path = cache_path
+        self.index = self.__get_link_index()
         self.years = self.__get_years(years)
 
     @property
@@ -50,9 +108,9 @@ class Scrapper:
         """
         Returns years to be downloaded
         """
-        years_parsed = self.soup.find_all("div", {"faq-questions"})
-        last_year = years_parsed[0].text.strip()
-        first_year = years_parsed[-1].text.strip()
+        years_parsed = sorted(self.index)
+        last_year = str(years_parsed[-1]) if years_parsed else ""
+        first_year = str(years_parsed[0]) if years_parsed else ""
         last_year, first_year = self.__format_parsed_years(
             last_year, first_year
         )
@@ -61,39 +119,117 @@ class Scrapper:
         )
         return list(range(sequence_start, last_year))
 
-    def __get_soup_html(self) -> BeautifulSoup:
+    def __load_cache(self) -> dict:
+        """
+        Cached link index of the url with its validators
+        """
+        if os.path.exists(self._cache_path):
+            with open(self._cache_path, "r", encoding="utf-8") as file:
+                cache = json.load(file)
+            if cache.get("url") == self.url:
+                return cache
+        return {}
+
+    def __save_cache(self,
+                     response: requests.Response,
+                     index: LinkIndex) -> None:
+        """
+        Atomically stores link index and page validators
+        """
+        cache = {
+            "url": self.url,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "links": [
+                [link.year, link.taxi_type, link.month, link.url]
+                for types in index.values()
+                for months in types.values()
+                for link in months.values()
+            ],
+        }
+        folder = os.path.dirname(self._cache_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = self._cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(cache, file)
+        os.replace(tmp_path, self._cache_path)
+
+    @staticmethod
+    def __make_index(links) -> LinkIndex:
         """
-        Getting HTML of a URL as a BS4 object
+        Builds year -> taxi type -> month index of links
+        """
+        index = {}
+        for link in links:
+            index.setdefault(link.year, {}).setdefault(
+                link.taxi_type, {}
+            )[link.month] = link
+        return index
+
+    def __get_link_index(self) -> LinkIndex:
         """
+        Link index from page cache revalidated
+        with If-None-Match/If-Modified-Since,
+        webpage is parsed only if it has changed
+        """
+        cache = self.__load_cache()
+        headers = {}
+        if cache.get("etag"):
+            headers["If-None-Match"] = cache["etag"]
+        if cache.get("last_modified"):
+            headers["If-Modified-Since"] = cache["last_modified"]
         print("Getting webpage HTML")
-        response = requests.get(self.url)
+        response = Downloader.get_session().get(self.url, headers=headers)
+        if response.status_code == 304 and cache:
+            print("Webpage is not modified, using cached links")
+            return self.__make_index(
+                TripLink(*link) for link in cache["links"]
+            )
         if response.status_code != 200:
             raise ConnectionError(
                 f"\nCannot connect to specified url:"
                 f" {self.url}\n"
                 f"Status code: {response.status_code}"
             )
-        return BeautifulSoup(response.text, "html.parser")
+        index = self.parse_links(response.text)
+        self.__save_cache(response, index)
+        return index
 
-    def get_links(self) -> dict:
+    @classmethod
+    def parse_links(cls, html: str) -> LinkIndex:
         """
         Parsing HTML for download links
+        in a single pass over trip records anchors
         """
         print("Parsing HTML for download links")
+        soup = BeautifulSoup(html, "html.parser")
+        links = []
+        for anchor in soup.find_all("a", title=LINK_TITLES.__contains__):
+            div_year = anchor.find_parent("div", id=cls.year_id_pattern)
+            month = cls.month_pattern.search(anchor.get("href", ""))
+            if div_year is None or month is None:
+                continue
+            links.append(TripLink(
+                year=int(cls.year_id_pattern.match(div_year["id"]).group(1)),
+                taxi_type=LINK_TITLES[anchor["title"]],
+                month=int(month.group(2)),
+                url=anchor["href"],
+            ))
+        return cls.__make_index(links)
+
+    def get_links(self, taxi_types: tuple = tuple(TAXI_TYPES)) -> dict:
+        """
+        Download links of selected years
+        {year: [link, ...]}
+        """
         links = {}
         for year in self.years:
-            div_year = self.soup.find("div", {"id": f"faq{year}"})
+            types = self.index.get(year, {})
             links[year] = [
-                a["href"]
-                for a in div_year.find_all(
-                    "a", {"title": "Yellow Taxi Trip Records"}
-                )
-            ]
-            links[year] += [
-                a["href"]
-                for a in div_year.find_all(
-                    "a", {"title": "Green Taxi Trip Records"}
-                )
+                types[taxi_type][month].url
+                for taxi_type in taxi_types
+                for month in sorted(types.get(taxi_type, {}))
             ]
         return links
 
@@ -106,6 +242,10 @@ class Downloader:
     """
 
     download_folder = DOWNLOAD_FOLDER
+    chunk_size = 655360
+    _session = None
+    _pool_size = 0
+    _session_lock = threading.Lock()
 
     def __init__(self, download_folder: str = download_folder):
         print("Initializing Downloader")
@@ -120,6 +260,27 @@ class Downloader:
         if not os.path.exists(self.download_folder):
             os.mkdir(self.download_folder)
 
+    @staticmethod
+    def get_session(
+            pool_size: int = DOWNLOAD_WORKERS * DOWNLOAD_SEGMENTS
+    ) -> requests.Session:
+        """
+        Shared connection-pooled HTTP session
+        with timeouts and retries,
+        a larger pool_size mounts a larger connection pool,
+        requests in flight finish on the previous one
+        """
+        with Downloader._session_lock:
+            if Downloader._session is None:
+                Downloader._session = transport.make_session(pool_size)
+                Downloader._pool_size = pool_size
+            elif pool_size > Downloader._pool_size:
+                transport.mount(
+                    Downloader._session, transport.make_adapter(pool_size)
+                )
+                Downloader._pool_size = pool_size
+            return Downloader._session
+
     @staticmethod
     def __make_filename(year: int, filename: str = "") -> str:
         """
@@ -142,70 +303,422 @@ class Downloader:
         Returns web file size
         for csv file downloading
         """
-        req = requests.head(link)
+        req = Downloader.get_session().head(link)
         file_web_length = int(req.headers.get("content-length", 0))
         return file_web_length
 
+    @staticmethod
+    def __head(link: str) -> requests.Response:
+        """
+        HEAD of a web file
+        """
+        return Downloader.get_session().head(link)
+
+    @staticmethod
+    def __record_source(link: str,
+                        filename: str,
+                        headers: dict) -> None:
+        """
+        Persists remote ETag, Last-Modified and size of a link
+        as pending until the file is stored,
+        an interrupted download is then "changed" on the next run
+        """
+        Catalog.shared().record_source(
+            link,
+            Logger(filename).filename,
+            etag=headers.get("etag"),
+            last_modified=headers.get("last-modified"),
+            size=int(headers.get("content-length", 0)) or None,
+            pending=True,
+        )
+
+    @staticmethod
+    def __file_is_converted(filename: str) -> bool:
+        """
+        Checks if a file is stored as avro, parquet or dataset
+        """
+        if format_name := Logger(filename).get_file_format():
+            if format_name == "dataset":
+                return bool(Converter.get_dataset_parts(filename))
+            if format_name in FORMATS and format_name != "csv":
+                if os.path.exists(
+                        Converter.change_filename_extension(filename,
+                                                            format_name)
+                ):
+                    return True
+        return False
+
     @staticmethod
     def __file_is_downloaded(filename: str,
                              file_web_length_bytes: int) -> bool:
         """
         Checks if a file is needed to be downloaded
         checks include csv, avro and parquet checking
+        a segment manifest means the transfer is unfinished
         """
+        if os.path.exists(Downloader.__make_manifest_filename(filename)):
+            return False
+        if os.path.exists(StreamConverter.get_checkpoint_filename(filename)):
+            return False
         if os.path.exists(filename):
             if os.path.getsize(filename) == file_web_length_bytes:
                 return True
+        return Downloader.__file_is_converted(filename)
 
-        logger = Logger(filename)
-        if logger.log_exists:
-            if (format_name := logger.get_file_format()) in FORMATS:
-                if os.path.exists(
-                        Converter.change_filename_extension(filename,
-                                                            format_name)
-                ):
-                    return True
-        return False
+    @staticmethod
+    def __get_source_state(link: str, filename: str) -> tuple:
+        """
+        Incremental check of a converted file without HEAD request:
+        recently revalidated files are "unchanged",
+        others are revalidated by a conditional GET.
+        "unknown" if there is no converted file or remote state,
+        "changed" if remote state is pending, its download is unfinished.
+        Returns state and headers of a 200 response or None
+        """
+        source = Catalog.shared().get_source(link)
+        if not source or not Downloader.__file_is_converted(filename):
+            return "unknown", None
+        if source["pending"]:
+            return "changed", None
+        checked = datetime.fromisoformat(source["checked"])
+        if (datetime.now() - checked).total_seconds() < REVALIDATE_AFTER:
+            return "unchanged", None
+        headers = {}
+        if source["etag"]:
+            headers["If-None-Match"] = source["etag"]
+        if source["last_modified"]:
+            headers["If-Modified-Since"] = source["last_modified"]
+        if not headers:
+            return "unknown", None
+        with Downloader.get_session().get(
+                link, stream=True, headers=headers
+        ) as req:
+            if req.status_code == 304:
+                Catalog.shared().touch_source(link)
+                return "unchanged", None
+            req.raise_for_status()
+            return "changed", req.headers
 
     @staticmethod
+    @METRICS.timed("download_file")
     def download(link: str,
                  filename: str,
                  file_web_length_bytes: int = None,
-                 i: list = None
+                 i: list = None,
+                 progress: Progress = None,
+                 retries: int = DOWNLOAD_RETRIES
                  ) -> None:
         """
         The Downloading process itself
+        with a shared progress, per-file output is replaced
+        by an aggregate one.
+        Interrupted transfers are resumed up to retries times
+        with exponential backoff, the file is verified at the end
         """
-        chunk_size = 655360
         if not file_web_length_bytes:
             file_web_length_bytes = Downloader.__get_file_length_web(link)
-        file_web_length = file_web_length_bytes / 1024 / 1024
         start_pos_bytes = (
             os.path.getsize(filename) if os.path.exists(filename) else 0
         )
-        resume_header = (
-            {"Range": f"bytes={start_pos_bytes}-"} if start_pos_bytes else None
-        )
-
         Downloader.__messages(
             link, file_web_length_bytes, i, start_pos_bytes=start_pos_bytes
         )
+        if progress is not None:
+            progress.add_total(
+                max(file_web_length_bytes - start_pos_bytes, 0)
+            )
+        for attempt in range(retries + 1):
+            try:
+                Downloader.__stream_to_file(
+                    link, filename, file_web_length_bytes, progress
+                )
+                break
+            except transport.TRANSIENT_ERRORS as error:
+                if attempt == retries:
+                    raise
+                METRICS.count("retries_total", stage="download")
+                delay = transport.backoff_delay(attempt)
+                print(f"\nRetrying {link} in {delay:.0f}s: {error}")
+                time.sleep(delay)
+        if progress is None:
+            print("")
+        Logger(filename).record_file_type(
+            "csv",
+            checksum=Downloader.verify(link, filename, file_web_length_bytes),
+        )
 
-        with requests.get(link, stream=True, headers=resume_header) as req:
+    @staticmethod
+    def __stream_to_file(link: str,
+                         filename: str,
+                         file_web_length_bytes: int,
+                         progress: Progress = None) -> None:
+        """
+        Streams link into filename from its current size,
+        a server ignoring Range answers 200 and the file is rewritten
+        instead of appending the whole body to it
+        """
+        file_web_length = file_web_length_bytes / 1024 / 1024
+        start_pos_bytes = (
+            os.path.getsize(filename) if os.path.exists(filename) else 0
+        )
+        if file_web_length_bytes and start_pos_bytes >= file_web_length_bytes:
+            if start_pos_bytes == file_web_length_bytes:
+                return
+            print(f"\nLocal file is larger than remote, restarting: {link}")
+            start_pos_bytes = 0
+        resume_header = (
+            {"Range": f"bytes={start_pos_bytes}-"} if start_pos_bytes else None
+        )
+        session = Downloader.get_session()
+        with session.get(link, stream=True, headers=resume_header) as req:
+            if start_pos_bytes and req.status_code == 416:
+                return
             req.raise_for_status()
+            if start_pos_bytes and req.status_code != 206:
+                print(f"\nServer ignored Range, restarting: {link}")
+                if progress is not None:
+                    progress.add_total(start_pos_bytes)
+                start_pos_bytes = 0
             with open(filename, "ab" if start_pos_bytes else "wb") as file:
-                progress = start_pos_bytes / 1024 / 1024
-                for chunk in req.iter_content(chunk_size=chunk_size):
+                file_progress = start_pos_bytes / 1024 / 1024
+                for chunk in req.iter_content(
+                        chunk_size=Downloader.chunk_size
+                ):
                     file.write(chunk)
-                    progress += chunk_size / 1024 / 1024
-                    progress = min(file_web_length, progress)
+                    METRICS.count("bytes_downloaded_total", len(chunk))
+                    if progress is not None:
+                        progress.update(len(chunk))
+                        continue
+                    file_progress += len(chunk) / 1024 / 1024
+                    file_progress = min(file_web_length, file_progress)
                     print(
-                        f"\r{progress:.2f}MB/"
+                        f"\r{file_progress:.2f}MB/"
                         f"{file_web_length:.2f}MB",
                         end="",
                     )
-        print("")
-        Logger(filename).record_file_type("csv")
+
+    @staticmethod
+    def verify(link: str,
+               filename: str,
+               file_web_length_bytes: int = None,
+               checksum: bool = VERIFY_CHECKSUM) -> str:
+        """
+        Verifies downloaded size against Content-Length
+        and MD5 against ETag when it is an MD5 digest.
+        A short file is kept to be resumed, a larger or
+        corrupted one is removed. Returns MD5 of the file
+        """
+        size = os.path.getsize(filename)
+        if file_web_length_bytes and size != file_web_length_bytes:
+            if size > file_web_length_bytes:
+                os.remove(filename)
+            raise transport.IntegrityError(
+                f"Size {size} does not match {file_web_length_bytes}: {link}"
+            )
+        md5 = Catalog.checksum(filename)
+        source = Catalog.shared().get_source(link) or {}
+        expected = transport.etag_md5(source.get("etag"))
+        if checksum and expected and md5 != expected:
+            os.remove(filename)
+            raise transport.IntegrityError(
+                f"Checksum {md5} does not match ETag {expected}: {link}"
+            )
+        return md5
+
+    @staticmethod
+    def __make_manifest_filename(filename: str) -> str:
+        """
+        Makes filename for a segmented download manifest
+        """
+        return filename + ".segments"
+
+    @staticmethod
+    def __supports_range(link: str) -> bool:
+        """
+        Checks if server answers Range requests with 206
+        """
+        with Downloader.get_session().get(
+                link, stream=True, headers={"Range": "bytes=0-0"}
+        ) as req:
+            return req.status_code == 206
+
+    @staticmethod
+    def __split_segments(file_web_length_bytes: int, segments: int) -> list:
+        """
+        Splits file length into [start, end, done] byte ranges
+        """
+        size = -(-file_web_length_bytes // segments)
+        return [
+            [start, min(start + size, file_web_length_bytes) - 1, False]
+            for start in range(0, file_web_length_bytes, size)
+        ]
+
+    @staticmethod
+    def __write_manifest(manifest_filename: str, manifest: dict) -> None:
+        """
+        Atomically rewrites segment manifest
+        """
+        tmp_filename = manifest_filename + ".tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        os.replace(tmp_filename, manifest_filename)
+
+    @staticmethod
+    def __load_manifest(filename: str,
+                        file_web_length_bytes: int,
+                        segments: int) -> dict:
+        """
+        Loads existing segment manifest or
+        preallocates file and creates a new one
+        """
+        manifest_filename = Downloader.__make_manifest_filename(filename)
+        if os.path.exists(manifest_filename):
+            with open(manifest_filename, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+            if (manifest["length"] == file_web_length_bytes
+                    and os.path.exists(filename)):
+                return manifest
+        manifest = {
+            "length": file_web_length_bytes,
+            "segments": Downloader.__split_segments(
+                file_web_length_bytes, segments
+            ),
+        }
+        with open(filename, "wb") as file:
+            file.truncate(file_web_length_bytes)
+        Downloader.__write_manifest(manifest_filename, manifest)
+        return manifest
+
+    @staticmethod
+    def __download_segment(link: str,
+                           filename: str,
+                           segment: list,
+                           progress: Progress,
+                           retries: int = DOWNLOAD_RETRIES) -> None:
+        """
+        Fetches one byte range into its position of the file,
+        an interrupted range is resumed from the last written byte
+        """
+        start, end, _ = segment
+        position = [start]
+        for attempt in range(retries + 1):
+            if position[0] > end:
+                break
+            try:
+                Downloader.__fetch_range(
+                    link, filename, position, end, progress
+                )
+                break
+            except transport.TRANSIENT_ERRORS as error:
+                if attempt == retries:
+                    raise
+                METRICS.count("retries_total", stage="segment")
+                delay = transport.backoff_delay(attempt)
+                print(f"\nRetrying {link} [{position[0]}-{end}]"
+                      f" in {delay:.0f}s: {error}")
+                time.sleep(delay)
+        if position[0] != end + 1:
+            raise requests.HTTPError(
+                f"Segment {start}-{end} is incomplete: {link}"
+            )
+
+    @staticmethod
+    def __fetch_range(link: str,
+                      filename: str,
+                      position: list,
+                      end: int,
+                      progress: Progress) -> None:
+        """
+        Writes bytes position[0]-end of link into the file,
+        position[0] follows every written chunk,
+        so after an error it is where the range resumes
+        """
+        headers = {"Range": f"bytes={position[0]}-{end}"}
+        session = Downloader.get_session()
+        with session.get(link, stream=True, headers=headers) as req:
+            req.raise_for_status()
+            if req.status_code != 206:
+                raise requests.HTTPError(
+                    f"Range request is ignored by server: {link}"
+                )
+            descriptor = os.open(filename, os.O_WRONLY)
+            try:
+                for chunk in req.iter_content(
+                        chunk_size=Downloader.chunk_size
+                ):
+                    os.pwrite(descriptor, chunk, position[0])
+                    position[0] += len(chunk)
+                    METRICS.count("bytes_downloaded_total", len(chunk))
+                    progress.update(len(chunk))
+            finally:
+                os.close(descriptor)
+
+    @staticmethod
+    @METRICS.timed("download_file_segmented")
+    def download_segmented(link: str,
+                           filename: str,
+                           file_web_length_bytes: int = None,
+                           i: list = None,
+                           progress: Progress = None,
+                           segments: int = DOWNLOAD_SEGMENTS
+                           ) -> None:
+        """
+        Downloads a file as concurrent byte ranges
+        into a preallocated file, finished segments are kept
+        in a manifest to resume only the missing ones,
+        also when another segment fails.
+        Falls back to a single stream if Range is not supported
+        """
+        if not file_web_length_bytes:
+            file_web_length_bytes = Downloader.__get_file_length_web(link)
+        manifest_filename = Downloader.__make_manifest_filename(filename)
+        if not file_web_length_bytes or not Downloader.__supports_range(link):
+            if os.path.exists(manifest_filename):
+                os.remove(manifest_filename)
+                os.remove(filename)
+            Downloader.download(
+                link, filename, file_web_length_bytes, i, progress
+            )
+            return
+
+        manifest = Downloader.__load_manifest(
+            filename, file_web_length_bytes, segments
+        )
+        missing = [seg for seg in manifest["segments"] if not seg[2]]
+        missing_bytes = sum(end - start + 1 for start, end, _ in missing)
+        Downloader.__messages(
+            link, file_web_length_bytes, i,
+            start_pos_bytes=file_web_length_bytes - missing_bytes
+        )
+        own_progress = progress is None
+        if own_progress:
+            progress = Progress()
+        progress.add_total(missing_bytes)
+
+        with ThreadPoolExecutor(max_workers=len(missing) or 1) as executor:
+            futures = {
+                executor.submit(
+                    METRICS.bind(Downloader.__download_segment),
+                    link, filename, segment, progress
+                ): segment
+                for segment in missing
+            }
+            errors = []
+            for future in as_completed(futures):
+                if error := future.exception():
+                    errors.append(error)
+                    continue
+                futures[future][2] = True
+                Downloader.__write_manifest(manifest_filename, manifest)
+        if errors:
+            raise errors[0]
+        if own_progress:
+            print("")
+        os.remove(manifest_filename)
+        Logger(filename).record_file_type(
+            "csv",
+            checksum=Downloader.verify(link, filename, file_web_length_bytes),
+        )
 
     @staticmethod
     def __get_links_count(links) -> int:
@@ -249,66 +762,199 @@ class Downloader:
             print(f"{message}")
 
     @staticmethod
-    def download_files(links: dict, bypass=None) -> None:
+    def download_files(links: dict,
+                       bypass=None,
+                       workers: int = DOWNLOAD_WORKERS,
+                       incremental: bool = INCREMENTAL,
+                       fused: bool = FUSED_PIPELINE) -> list:
         """
         Downloader methods Main wrapper
+        workers > 1 downloads files concurrently,
+        incremental skips converted files unchanged on the server,
+        fused streams downloads into parquet dataset without csv.
+        Returns failed links
         """
         print("Downloading files...")
         if bypass:
-            Downloader.__bypass_download()
-        else:
-            Downloader.__iterator(links)
+            return Downloader.__bypass_download()
+        if workers > 1:
+            return Downloader.__parallel_iterator(
+                links, workers, incremental, fused
+            )
+        return Downloader.__iterator(links, incremental, fused)
 
     @staticmethod
-    def __bypass_download() -> None:
+    def __bypass_download() -> list:
         """
         Method to bypass downloading all datasets
         and to download 1 file
         for dev purpose only
         """
         print("Bypassing download of all files")
-        link = (
-            "https://s3.amazonaws.com/nyc-tlc/trip+data/"
-            "green_tripdata_2021-01.csv"
-        )
-        Downloader.__prepare_year_folder(2021)
-        Downloader.__download_pipeline(link, 2021, [1, 1])
+        return Downloader.__iterator({2021: [BYPASS_LINK]})
 
     @staticmethod
-    def __iterator(links: dict) -> None:
+    def __iterator(links: dict,
+                   incremental: bool = False,
+                   fused: bool = False) -> list:
         """
-        Iterator over links from Scrapper
+        Iterator over links from Scrapper,
+        an error of a link does not stop the others
         """
         i = [0, Downloader.__get_links_count(links)]
+        failed = []
         for year in links:
             Downloader.__prepare_year_folder(year)
             for link in links[year]:
                 i[0] += 1
-                Downloader.__download_pipeline(link, year, i)
+                try:
+                    Downloader.__download_pipeline(
+                        link, year, i, incremental=incremental, fused=fused
+                    )
+                except Exception as error:  # pylint: disable=broad-except
+                    Downloader.__fail(link, error, failed)
+        return Downloader.__report_failed(failed, i[1])
+
+    @staticmethod
+    def __fail(link: str, error: Exception, failed: list) -> None:
+        """
+        Records a failed link, the batch goes on
+        """
+        METRICS.count("files_total", stage="download", status="failed")
+        failed.append(link)
+        print(f"\nFailed to download {link}: {error}")
 
     @staticmethod
-    def __download_pipeline(link: str, year: int, i: list = None) -> None:
+    def __report_failed(failed: list, total: int) -> list:
         """
-        High-level downloading method
+        Prints failed links count, returns failed links
+        """
+        print("")
+        if failed:
+            print(f"{len(failed)}/{total} files failed to download")
+        return failed
+
+    @staticmethod
+    def __parallel_iterator(links: dict,
+                            workers: int,
+                            incremental: bool = False,
+                            fused: bool = False) -> list:
+        """
+        Concurrent iterator over links from Scrapper
+        bounded by a thread pool of workers,
+        an error of a link does not stop the others
+        """
+        total = Downloader.__get_links_count(links)
+        progress = Progress()
+        Downloader.get_session(workers * DOWNLOAD_SEGMENTS)
+        failed = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            count = 0
+            for year in links:
+                Downloader.__prepare_year_folder(year)
+                for link in links[year]:
+                    count += 1
+                    future = executor.submit(
+                        METRICS.bind(Downloader.__download_pipeline),
+                        link, year, [count, total], progress,
+                        incremental, fused
+                    )
+                    futures[future] = link
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as error:  # pylint: disable=broad-except
+                    Downloader.__fail(futures[future], error, failed)
+        return Downloader.__report_failed(failed, total)
+
+    @staticmethod
+    def download_link(link: str,
+                      year: int,
+                      i: list = None,
+                      progress: Progress = None,
+                      incremental: bool = INCREMENTAL,
+                      fused: bool = FUSED_PIPELINE) -> str:
+        """
+        Downloads one link of a year for schedulers
+        running their own workers, returns csv filename[path]
+        """
+        os.makedirs(Downloader.__make_filename(year), exist_ok=True)
+        Downloader.__download_pipeline(
+            link, year, i, progress, incremental, fused
+        )
+        return Downloader.__make_filename(year, link.split("/")[-1])
+
+    @staticmethod
+    def __download_pipeline(link: str,
+                            year: int,
+                            i: list = None,
+                            progress: Progress = None,
+                            incremental: bool = False,
+                            fused: bool = False) -> None:
+        """
+        High-level downloading method,
+        remote state is confirmed once the file is stored:
+        downloaded csv is then not converted until Converter runs,
+        fused conversion stores the dataset itself
         """
         filename = Downloader.__make_filename(year, link.split("/")[-1])
-        file_web_length_bytes = Downloader.__get_file_length_web(link)
-        if not Downloader.__file_is_downloaded(
+        state, headers = (
+            Downloader.__get_source_state(link, filename)
+            if incremental else ("unknown", None)
+        )
+        if state == "unchanged":
+            METRICS.count("files_total", stage="download", status="skipped")
+            message = f"File is unchanged: {link}"
+            print(f"[{i[0]}/{i[1]}] {message}" if i else message)
+            return
+        if headers is None:
+            headers = Downloader.__head(link).headers
+        Downloader.__record_source(link, filename, headers)
+        file_web_length_bytes = int(headers.get("content-length", 0))
+        if state == "changed" or not Downloader.__file_is_downloaded(
                 filename, file_web_length_bytes
         ):
-            Downloader.download(link, filename, file_web_length_bytes, i)
+            if fused:
+                Downloader.__messages(link, file_web_length_bytes, i)
+                StreamConverter(Downloader.get_session()).convert(
+                    link, filename, file_web_length_bytes, progress
+                )
+                Catalog.shared().confirm_source(link)
+                METRICS.count("files_total", stage="download", status="ok")
+                return
+            segmented = (
+                file_web_length_bytes >= SEGMENT_MIN_SIZE
+                or os.path.exists(
+                    Downloader.__make_manifest_filename(filename)
+                )
+            )
+            if DOWNLOAD_SEGMENTS > 1 and segmented:
+                Downloader.download_segmented(
+                    link, filename, file_web_length_bytes, i, progress
+                )
+            else:
+                Downloader.download(
+                    link, filename, file_web_length_bytes, i, progress
+                )
+            Catalog.shared().confirm_source(link)
+            METRICS.count("files_total", stage="download", status="ok")
         else:
+            Catalog.shared().confirm_source(link)
+            METRICS.count("files_total", stage="download", status="skipped")
             Downloader.__messages(
                 link, file_web_length_bytes, i, downloaded=True
             )
 
 
-def run(url: str = URL, bypass: bool = False) -> None:
+def run(url: str = URL, bypass: bool = False) -> list:
     """
     Data pipeline for
-    Scrapper
+    Scrapper, returns failed links
     """
-    scrapper = Scrapper(url)
-    links = scrapper.get_links()
-    downloader = Downloader()
-    downloader.download_files(links, bypass=bypass)
+    with METRICS.stage("scrape"):
+        scrapper = Scrapper(url)
+        links = scrapper.get_links()
+    with METRICS.stage("download"):
+        downloader = Downloader()
+        return downloader.download_files(links, bypass=bypass)
@@ -0,0 +1,220 @@
+"""
+Streaming Module
+download to parquet dataset without intermediate csv
+"""
+import io
+import json
+import os
+import time
+import requests
+from app.config import (
+    DATASET_FOLDER,
+    STREAM_BLOCK_SIZE,
+    ROLLUPS,
+    COMPACT_TYPES,
+    DOWNLOAD_RETRIES,
+    PARQUET_SORTED,
+)
+from app.converter import Converter
+from app.logger import Logger
+from app.metrics import METRICS
+from app.rollups import Rollups
+from app.utils import Progress
+from app import schema, transport
+
+
+class StreamConverter:
+    """
+    Fused download and conversion:
+    http response is cut into blocks at line boundaries,
+    each block is parsed and written as partition files.
+    A checkpoint keeps the consumed byte offset,
+    so an interrupted transfer resumes with a Range request,
+    transient errors resume it in place up to retries times.
+    sort writes partition files of blocks sorted by pickup datetime
+    """
+
+    chunk_size = 655360
+
+    def __init__(self,
+                 session: requests.Session = None,
+                 dataset_folder: str = DATASET_FOLDER,
+                 block_size: int = STREAM_BLOCK_SIZE,
+                 rollups: bool = ROLLUPS,
+                 compact: bool = COMPACT_TYPES,
+                 retries: int = DOWNLOAD_RETRIES,
+                 sort: bool = PARQUET_SORTED):
+        self.session = session or transport.make_session()
+        self.dataset_folder = dataset_folder
+        self.block_size = block_size
+        self.rollups = rollups
+        self.compact = compact
+        self.retries = retries
+        self.sort = sort
+        self.converter = Converter()
+
+    @staticmethod
+    def get_checkpoint_filename(filename: str) -> str:
+        """
+        Makes filename for a streaming checkpoint
+        """
+        return filename + ".stream"
+
+    def __load_checkpoint(self, filename: str, length: int) -> dict:
+        """
+        Loads checkpoint of the same remote length or a new one
+        """
+        checkpoint_filename = self.get_checkpoint_filename(filename)
+        if os.path.exists(checkpoint_filename):
+            with open(checkpoint_filename, "r", encoding="utf-8") as file:
+                checkpoint = json.load(file)
+            if checkpoint["length"] == length:
+                return checkpoint
+        return {"length": length, "offset": 0, "header": "",
+                "block": 0, "rows": 0, "parts": []}
+
+    def __save_checkpoint(self, filename: str, checkpoint: dict) -> None:
+        """
+        Atomically rewrites checkpoint
+        """
+        checkpoint_filename = self.get_checkpoint_filename(filename)
+        tmp_filename = checkpoint_filename + ".tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as file:
+            json.dump(checkpoint, file)
+        os.replace(tmp_filename, checkpoint_filename)
+
+    def __write_block(self,
+                      filename: str,
+                      checkpoint: dict,
+                      block: bytes) -> None:
+        """
+        Parses csv block and writes its partition files,
+        block files are named by block number,
+        so a block repeated after a crash overwrites its files
+        """
+        header = checkpoint["header"].encode()
+        taxi_type = self.converter.get_taxi_type(filename)
+        taxi_schema = schema.get_taxi_schema(taxi_type)
+        stem = self.converter.get_part_filename(filename)[:-len(".parquet")]
+        part_filename = f"{stem}-{checkpoint['block']:05d}.parquet"
+        for table in self.converter.iter_csv_arrow(
+                io.BytesIO(header + block), taxi_type=taxi_type
+        ):
+            table = schema.normalize(table, taxi_schema)
+            if self.compact:
+                table = schema.compact(table, taxi_schema)
+            for (year, month), part in self.converter.split_by_month(table):
+                folder = self.converter.get_partition_folder(
+                    self.dataset_folder, taxi_type, year, month
+                )
+                os.makedirs(folder, exist_ok=True)
+                path = os.path.join(folder, part_filename)
+                if self.sort:
+                    self.converter.write_sorted_parquet(part, path)
+                else:
+                    self.converter.write_parquet(part, path)
+                checkpoint["rows"] += part.num_rows
+                if path not in checkpoint["parts"]:
+                    checkpoint["parts"].append(path)
+        checkpoint["offset"] += len(block)
+        checkpoint["block"] += 1
+        self.__save_checkpoint(filename, checkpoint)
+
+    def __open(self, link: str, checkpoint: dict) -> requests.Response:
+        """
+        Opens response stream from checkpoint offset,
+        if server ignores Range, conversion restarts from zero
+        """
+        headers = (
+            {"Range": f"bytes={checkpoint['offset']}-"}
+            if checkpoint["offset"] else None
+        )
+        req = self.session.get(link, stream=True, headers=headers)
+        req.raise_for_status()
+        if checkpoint["offset"] and req.status_code != 206:
+            checkpoint.update(offset=0, header="", block=0, rows=0, parts=[])
+        return req
+
+    def __consume(self,
+                  link: str,
+                  filename: str,
+                  checkpoint: dict,
+                  buffer: bytearray,
+                  progress: Progress = None) -> None:
+        """
+        Reads response from checkpoint offset into blocks,
+        buffer holds bytes after the last written block
+        """
+        with self.__open(link, checkpoint) as req:
+            for chunk in req.iter_content(chunk_size=self.chunk_size):
+                if progress is not None:
+                    progress.update(len(chunk))
+                METRICS.count("bytes_downloaded_total", len(chunk))
+                buffer += chunk
+                if not checkpoint["header"]:
+                    if (end := buffer.find(b"\n")) < 0:
+                        continue
+                    checkpoint["header"] = buffer[:end + 1].decode()
+                    checkpoint["offset"] = end + 1
+                    del buffer[:end + 1]
+                if len(buffer) >= self.block_size:
+                    cut = buffer.rfind(b"\n") + 1
+                    if cut:
+                        self.__write_block(
+                            filename, checkpoint, bytes(buffer[:cut])
+                        )
+                        del buffer[:cut]
+        if buffer.strip():
+            self.__write_block(filename, checkpoint, bytes(buffer))
+
+    @METRICS.timed("stream_file")
+    def convert(self,
+                link: str,
+                filename: str,
+                file_web_length_bytes: int = 0,
+                progress: Progress = None) -> str:
+        """
+        Streams link into partitioned parquet dataset
+        filename is the csv path the file would have,
+        it names partition files and catalog record
+        """
+        checkpoint = self.__load_checkpoint(filename, file_web_length_bytes)
+        Rollups("dataset").remove(filename)
+        if progress is not None:
+            progress.add_total(file_web_length_bytes - checkpoint["offset"])
+        buffer = bytearray()
+        for attempt in range(self.retries + 1):
+            try:
+                self.__consume(link, filename, checkpoint, buffer, progress)
+                break
+            except transport.TRANSIENT_ERRORS as error:
+                if attempt == self.retries:
+                    raise
+                METRICS.count("retries_total", stage="stream")
+                if progress is not None:
+                    progress.add_total(len(buffer))
+                buffer.clear()
+                delay = transport.backoff_delay(attempt)
+                print(f"\nRetrying {link} in {delay:.0f}s: {error}")
+                time.sleep(delay)
+
+        for path in self.converter.get_dataset_parts(
+                filename, self.dataset_folder
+        ):
+            if path not in checkpoint["parts"]:
+                os.remove(path)
+        if self.rollups:
+            Rollups("dataset").write_from_parts(filename, checkpoint["parts"])
+        METRICS.count(
+            "rows_processed_total", checkpoint["rows"], format="dataset"
+        )
+        Logger(filename).record_file_type(
+            "dataset",
+            rows=checkpoint["rows"],
+            size=sum(os.path.getsize(path) for path in checkpoint["parts"]),
+        )
+        if os.path.exists(checkpoint_filename := self.get_checkpoint_filename(
+                filename
+        )):
+            os.remove(checkpoint_filename)
+        return self.dataset_folder
@@ -0,0 +1,122 @@
+"""
+Transport Module
+pooled HTTP sessions with timeouts and retries
+"""
+import re
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.config import (
+    HTTP_TIMEOUT,
+    HTTP_RETRIES,
+    HTTP_BACKOFF,
+    HTTP_BACKOFF_MAX,
+)
+from app.metrics import METRICS
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+MD5_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class IntegrityError(requests.RequestException):
+    """
+    Downloaded file does not match remote size or checksum
+    """
+
+
+class CountedRetry(Retry):
+    """
+    urllib3 Retry which counts retried requests in metrics
+    """
+
+    def increment(self, *args, **kwargs):
+        METRICS.count("retries_total", stage="request")
+        return super().increment(*args, **kwargs)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter with a default (connect, read) timeout,
+    so no request waits forever on a stalled connection
+    """
+
+    def __init__(self, *args, timeout: tuple = HTTP_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def make_adapter(pool_size: int = 10,
+                 retries: int = HTTP_RETRIES,
+                 backoff: float = HTTP_BACKOFF,
+                 timeout: tuple = HTTP_TIMEOUT) -> TimeoutHTTPAdapter:
+    """
+    Connection pool of pool_size connections per host,
+    connection errors and retryable statuses of GET and HEAD
+    are retried with exponential backoff
+    """
+    retry = CountedRetry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+    )
+    return TimeoutHTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+        timeout=timeout,
+    )
+
+
+def mount(session: requests.Session, adapter: HTTPAdapter) -> None:
+    """
+    Mounts adapter for http and https
+    """
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+def make_session(pool_size: int = 10,
+                 retries: int = HTTP_RETRIES,
+                 backoff: float = HTTP_BACKOFF,
+                 timeout: tuple = HTTP_TIMEOUT) -> requests.Session:
+    """
+    Connection-pooled session with timeouts and retries
+    """
+    session = requests.Session()
+    mount(session, make_adapter(pool_size, retries, backoff, timeout))
+    return session
+
+
+def backoff_delay(attempt: int,
+                  backoff: float = HTTP_BACKOFF,
+                  backoff_max: float = HTTP_BACKOFF_MAX) -> float:
+    """
+    Exponential delay before a resumed transfer
+    """
+    return min(backoff * 2 ** attempt, backoff_max)
+
+
+def etag_md5(etag: str) -> str:
+    """
+    MD5 hex digest of content if ETag is one,
+    S3 ETags of single part uploads are MD5 of the object
+    """
+    if not etag:
+        return None
+    etag = etag.strip()
+    if etag.startswith("W/"):
+        return None
+    etag = etag.strip('"').lower()
+    return etag if MD5_PATTERN.match(etag) else None
@@ -1,18 +1,56 @@
 """
 Additional Utilities module
 """
+import functools
 from datetime import datetime
+from threading import Lock
 from typing import Callable
+from app.metrics import METRICS
 
 
 def exe_time(func: Callable) -> Callable:
     """
     Decorator to print
     Function Execution Time
+    duration is registered in metrics, return value is preserved
     """
+    @functools.wraps(func)
     def inner(*args, **kwargs):
         start_time = datetime.now()
-        func(*args, **kwargs)
-        print(datetime.now() - start_time)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = datetime.now() - start_time
+            METRICS.observe(func.__qualname__, duration.total_seconds())
+            print(duration)
 
     return inner
+
+
+class Progress:
+    """
+    Thread-safe aggregate progress
+    for concurrent downloads
+    """
+
+    def __init__(self, total_bytes: int = 0):
+        self._lock = Lock()
+        self._total_bytes = total_bytes
+        self._done_bytes = 0
+
+    def add_total(self, length_bytes: int) -> None:
+        """
+        Extends expected total by a file size
+        """
+        with self._lock:
+            self._total_bytes += length_bytes
+
+    def update(self, length_bytes: int) -> None:
+        """
+        Registers downloaded bytes and prints aggregate progress
+        """
+        with self._lock:
+            self._done_bytes += length_bytes
+            done = min(self._done_bytes, self._total_bytes) / 1024 / 1024
+            total = self._total_bytes / 1024 / 1024
+            print(f"\r{done:.2f}MB/{total:.2f}MB", end="")
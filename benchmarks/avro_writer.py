@@ -0,0 +1,76 @@
+"""
+Benchmark of csv to avro writers
+
+Usage:
+    python -m benchmarks.avro_writer ./records/2021/green_tripdata_2021-01.csv
+"""
+import os
+import shutil
+import sys
+import tempfile
+import pandas as pd
+from fastavro import writer
+from app.converter import Converter
+from app import schema
+from benchmarks.measure import run_isolated
+
+
+def legacy_csv_to_avro(filename: str) -> int:
+    """
+    Previous implementation:
+    container reopened per chunk and chunks materialized as dict lists
+    """
+    converter = Converter()
+    filename_avro = converter.change_filename_extension(filename, "avro")
+    parsed_schema = schema.parsed_avro_schema()
+    with open(filename_avro, "wb"):
+        pass
+    with pd.read_csv(
+        filename, converters=converter.converters,
+        chunksize=converter.chunksize
+    ) as d_frame:
+        for chunk in d_frame:
+            records = chunk.to_dict("records")
+            with open(filename_avro, "ab+") as out:
+                writer(out, parsed_schema, records, codec="snappy")
+    return os.path.getsize(filename_avro)
+
+
+def streaming_csv_to_avro(filename: str) -> int:
+    """
+    Current implementation
+    """
+    return os.path.getsize(Converter().csv_to_avro(filename))
+
+
+def main(filename: str) -> None:
+    """
+    Compares throughput and peak RSS of avro writers
+    """
+    size = os.path.getsize(filename) / 1024 / 1024
+    with open(filename, "rb") as file:
+        rows = sum(1 for _ in file) - 1
+    print(f"File: {filename}, Size: {size:.2f} MB, Rows: {rows}")
+    for name, func in [
+        ("legacy", legacy_csv_to_avro),
+        ("streaming", streaming_csv_to_avro),
+    ]:
+        with tempfile.TemporaryDirectory(dir=".") as folder:
+            copy = shutil.copy(
+                filename,
+                os.path.join(
+                    ".", os.path.relpath(folder), os.path.basename(filename)
+                ),
+            )
+            run = run_isolated(func, copy)
+        print(
+            f"{name:>9}: {run['seconds']:.2f}s,"
+            f" {rows / run['seconds']:.0f} rows/s,"
+            f" {size / run['seconds']:.2f} MB/s,"
+            f" peak RSS {run['peak_rss_mb']:.0f} MB,"
+            f" output {run['result'] / 1024 / 1024:.2f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
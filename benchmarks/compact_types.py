@@ -0,0 +1,60 @@
+"""
+Benchmark of default and compact parquet column types
+
+Usage:
+    python -m benchmarks.compact_types \
+        ./records/2021/green_tripdata_2021-01.csv
+"""
+import os
+import shutil
+import sys
+import tempfile
+import pyarrow.parquet as pq
+from app.converter import Converter
+from benchmarks.measure import run_isolated
+
+
+def convert(filename: str, compact: bool) -> dict:
+    """
+    Converts csv to parquet and measures
+    file size, arrow table and pandas DataFrame memory
+    """
+    converter = Converter()
+    filename_parquet = converter.csv_to_parquet(
+        filename, rollups=False, compact=compact
+    )
+    table = pq.read_table(filename_parquet)
+    return {
+        "size": os.path.getsize(filename_parquet),
+        "arrow": table.nbytes,
+        "pandas": int(table.to_pandas().memory_usage(deep=True).sum()),
+    }
+
+
+def main(filename: str) -> None:
+    """
+    Compares output size and memory of column types
+    """
+    megabyte = 1024 * 1024
+    size = os.path.getsize(filename) / megabyte
+    print(f"File: {filename}, Size: {size:.2f} MB")
+    for name, compact in [("default", False), ("compact", True)]:
+        with tempfile.TemporaryDirectory(dir=".") as folder:
+            copy = shutil.copy(
+                filename,
+                os.path.join(
+                    ".", os.path.relpath(folder), os.path.basename(filename)
+                ),
+            )
+            run = run_isolated(convert, copy, compact)
+        print(
+            f"{name:>7}: {run['seconds']:.2f}s,"
+            f" output {run['result']['size'] / megabyte:.2f} MB,"
+            f" arrow {run['result']['arrow'] / megabyte:.2f} MB,"
+            f" pandas {run['result']['pandas'] / megabyte:.2f} MB,"
+            f" peak RSS {run['peak_rss_mb']:.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
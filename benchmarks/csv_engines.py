@@ -0,0 +1,69 @@
+"""
+Benchmark of csv parsing engines
+
+Usage:
+    python -m benchmarks.csv_engines ./records/2021/green_tripdata_2021-01.csv
+"""
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+from app.converter import Converter
+
+
+def bench_engine(converter: Converter, filename: str, engine: str) -> dict:
+    """
+    Times parsing only and full csv to parquet conversion
+    on a copy of the file, since conversion removes the source.
+    The copy is kept under ./ as converter works with relative paths
+    """
+    start_time = datetime.now()
+    rows = sum(
+        table.num_rows for table in converter.iter_csv(filename, engine=engine)
+    )
+    parse_time = (datetime.now() - start_time).total_seconds()
+
+    with tempfile.TemporaryDirectory(dir=".") as folder:
+        copy = shutil.copy(
+            filename,
+            os.path.join(
+                ".", os.path.relpath(folder), os.path.basename(filename)
+            ),
+        )
+        start_time = datetime.now()
+        converter.csv_to_parquet(copy, engine=engine)
+        convert_time = (datetime.now() - start_time).total_seconds()
+    return {
+        "engine": engine,
+        "rows": rows,
+        "parse_s": parse_time,
+        "convert_s": convert_time,
+        "rows_per_s": rows / parse_time if parse_time else 0,
+    }
+
+
+def main(filename: str) -> None:
+    """
+    Compares pandas converters with typed arrow engine
+    """
+    converter = Converter()
+    size = os.path.getsize(filename) / 1024 / 1024
+    print(f"File: {filename}, Size: {size:.2f} MB")
+    results = [
+        bench_engine(converter, filename, engine)
+        for engine in ["pandas", "arrow"]
+    ]
+    for result in results:
+        print(
+            f"{result['engine']:>7}: {result['rows']} rows,"
+            f" parse {result['parse_s']:.2f}s,"
+            f" convert {result['convert_s']:.2f}s,"
+            f" {result['rows_per_s']:.0f} rows/s"
+        )
+    speedup = results[0]["parse_s"] / (results[1]["parse_s"] or 1)
+    print(f"arrow parsing speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,92 @@
+"""
+Local HTTP stand-in of the TLC file server
+serves a folder with HEAD and single Range requests
+"""
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Static files handler answering
+    Range: bytes=start-end with 206 Partial Content
+    """
+
+    range_pattern = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+    def __init__(self, *args, **kwargs):
+        self.range_length = None
+        super().__init__(*args, **kwargs)
+
+    def send_head(self):
+        """
+        Headers of a whole file or of a requested byte range
+        """
+        self.range_length = None
+        path = self.translate_path(self.path)
+        match = self.range_pattern.match(self.headers.get("Range", ""))
+        if match is None or not os.path.isfile(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(size - int(last or 0), 0), size - 1
+        if start >= size or start > end:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        file = open(path, "rb")  # pylint: disable=consider-using-with
+        file.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.range_length = end - start + 1
+        return file
+
+    def copyfile(self, source, outputfile) -> None:
+        """
+        Copies only the requested range
+        """
+        if self.range_length is None:
+            shutil.copyfileobj(source, outputfile)
+            return
+        remaining = self.range_length
+        while remaining and (chunk := source.read(min(remaining, 65536))):
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+    def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+        """
+        Quiet server
+        """
+
+
+@contextmanager
+def serve(folder: str, handler=RangeRequestHandler):
+    """
+    Serves folder on a free localhost port in a thread
+    yields base url
+    """
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(handler, directory=folder)
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        server.server_close()
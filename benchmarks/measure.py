@@ -0,0 +1,30 @@
+"""
+Measuring helpers for benchmarks
+"""
+import multiprocessing
+import resource
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable
+
+
+def _timed(func: Callable, *args) -> dict:
+    """
+    Inner Scope of a fresh process
+    Runs func and reports duration and peak RSS
+    """
+    start_time = datetime.now()
+    result = func(*args)
+    seconds = (datetime.now() - start_time).total_seconds()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"result": result, "seconds": seconds, "peak_rss_mb": peak_rss}
+
+
+def run_isolated(func: Callable, *args) -> dict:
+    """
+    Runs func in a new spawned process,
+    so peak RSS belongs to this run only
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(_timed, func, *args).result()
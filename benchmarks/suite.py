@@ -0,0 +1,180 @@
+"""
+Benchmark suite of download, conversion and query stages
+over synthetic records, results are written as JSON
+so runs can be compared
+
+Usage:
+    python -m benchmarks.suite --rows 1000000 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+import pyarrow as pa
+from app.converter import Converter
+from app.queries import ArrowQueries, ShardedQueries
+from app.scrapper import Downloader
+from app.utils import Progress
+from benchmarks.http_server import serve
+from benchmarks.measure import run_isolated
+from benchmarks.synthetic import generate_csv
+
+YEAR = 2021
+MONTH = 1
+STAGES = [
+    "download",
+    "download_segmented",
+    "csv_to_parquet",
+    "csv_to_dataset",
+    "csv_to_avro",
+    "avro_to_parquet",
+    "queries_scan",
+    "queries_rollups",
+    "queries_sharded",
+]
+
+
+def get_record_filename(taxi_type: str, extension: str) -> str:
+    """
+    Record path relative to a work folder
+    """
+    return os.path.join(
+        ".", "records", str(YEAR),
+        f"{taxi_type}_tripdata_{YEAR}-{MONTH:02d}.{extension}",
+    )
+
+
+def run_stage(folder: str, stage: str, taxi_type: str, url: str) -> None:
+    """
+    Inner Scope of a fresh process
+    Runs a stage inside work folder, config paths are relative,
+    stage output goes to stderr to keep stdout for JSON
+    """
+    os.chdir(folder)
+    with redirect_stdout(sys.stderr):
+        _run_stage(stage, taxi_type, url)
+
+
+def _run_stage(stage: str, taxi_type: str, url: str) -> None:
+    """
+    Inner Scope
+    Runs a stage
+    """
+    csv_filename = get_record_filename(taxi_type, "csv")
+    converter = Converter()
+    if stage == "download":
+        Downloader.download(url, csv_filename, progress=Progress())
+    elif stage == "download_segmented":
+        Downloader.download_segmented(url, csv_filename, progress=Progress())
+    elif stage == "csv_to_parquet":
+        converter.csv_to_parquet(csv_filename)
+    elif stage == "csv_to_dataset":
+        converter.csv_to_dataset(csv_filename)
+    elif stage == "csv_to_avro":
+        converter.csv_to_avro(csv_filename)
+    elif stage == "avro_to_parquet":
+        converter.avro_to_parquet(get_record_filename(taxi_type, "avro"))
+    elif stage.startswith("queries_"):
+        backend = (
+            ShardedQueries if stage == "queries_sharded" else ArrowQueries
+        )
+        queries = backend(
+            YEAR, YEAR, taxi_type,
+            rollups=stage == "queries_rollups", cache=False,
+        )
+        queries.average_trip_distance()
+        queries.busiest_hours()
+        queries.lowest_single_rider_weekday()
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+
+
+def prepare_stage(folder: str, stage: str, source: str, taxi_type: str):
+    """
+    Stage input outside of measured time:
+    downloads start from an empty file,
+    csv conversions consume a fresh copy of source csv
+    """
+    csv_filename = os.path.join(folder, get_record_filename(taxi_type, "csv"))
+    os.makedirs(os.path.dirname(csv_filename), exist_ok=True)
+    if os.path.exists(csv_filename):
+        os.remove(csv_filename)
+    if stage.startswith("csv_to_"):
+        shutil.copy(source, csv_filename)
+
+
+def run(rows: int, taxi_type: str = "green", stages: list = None) -> dict:
+    """
+    Generates records and runs each stage in a spawned process
+    """
+    stages = stages or STAGES
+    results = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pyarrow": pa.__version__,
+        "taxi_type": taxi_type,
+        "rows": rows,
+        "stages": {},
+    }
+    with tempfile.TemporaryDirectory(dir=".") as folder:
+        folder = os.path.abspath(folder)
+        source_folder = os.path.join(folder, "source")
+        os.makedirs(source_folder)
+        source = os.path.join(
+            source_folder,
+            os.path.basename(get_record_filename(taxi_type, "csv")),
+        )
+        size = generate_csv(source, rows, taxi_type, YEAR, MONTH)
+        results["csv_mb"] = size / 1024 / 1024
+        with serve(source_folder) as base_url:
+            url = base_url + os.path.basename(source)
+            for stage in stages:
+                prepare_stage(folder, stage, source, taxi_type)
+                measured = run_isolated(
+                    run_stage, folder, stage, taxi_type, url
+                )
+                seconds = measured["seconds"]
+                results["stages"][stage] = {
+                    "seconds": seconds,
+                    "rows_per_s": rows / seconds if seconds else None,
+                    "mb_per_s": (
+                        results["csv_mb"] / seconds if seconds else None
+                    ),
+                    "peak_rss_mb": measured["peak_rss_mb"],
+                }
+                print(
+                    f"{stage:>18}: {seconds:.2f}s,"
+                    f" {rows / seconds:.0f} rows/s,"
+                    f" peak RSS {measured['peak_rss_mb']:.0f} MB",
+                    file=sys.stderr,
+                )
+    return results
+
+
+def main() -> None:
+    """
+    Command line interface
+    """
+    parser = argparse.ArgumentParser(description="TLC pipeline benchmarks")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--taxi-type", default="green")
+    parser.add_argument(
+        "--stage", action="append", choices=STAGES, dest="stages"
+    )
+    parser.add_argument("--output", help="JSON file, stdout by default")
+    args = parser.parse_args()
+    results = run(args.rows, args.taxi_type, args.stages)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Synthetic TLC-shaped csv records generated from avro schemas
+
+Usage:
+    python -m benchmarks.synthetic ./green_tripdata_2021-01.csv 1000000
+"""
+import sys
+import numpy as np
+import pandas as pd
+from app import schema
+
+LOCATIONS = 265
+
+
+def generate_column(field: dict,
+                    rows: int,
+                    pickup: pd.Series,
+                    rng: np.random.Generator) -> pd.Series:
+    """
+    Values of an avro schema field,
+    names choose plausible ranges of TLC columns
+    """
+    name = field["name"]
+    if schema.is_datetime_field(field):
+        if "pickup" in name.lower():
+            values = pickup
+        else:
+            values = pickup + pd.to_timedelta(
+                rng.integers(60, 3600, rows), unit="s"
+            )
+        return values.dt.strftime("%Y-%m-%d %H:%M:%S")
+    avro_type = field["type"]
+    if avro_type in ("int", "long"):
+        if name.lower().endswith("locationid"):
+            return pd.Series(rng.integers(1, LOCATIONS + 1, rows))
+        if name == "passenger_count":
+            return pd.Series(rng.choice(
+                [1, 2, 3, 4, 5, 6], rows, p=[.7, .12, .06, .04, .05, .03]
+            ))
+        return pd.Series(rng.integers(1, 3, rows))
+    if avro_type in ("float", "double"):
+        if name == "trip_distance":
+            return pd.Series(rng.exponential(3.0, rows).round(2))
+        return pd.Series(rng.uniform(0, 50, rows).round(2))
+    if "flag" in name.lower():
+        return pd.Series(rng.choice(["N", "Y"], rows, p=[.99, .01]))
+    return pd.Series(
+        [f"B{code:05d}" for code in rng.integers(0, 1000, rows)]
+    )
+
+
+def generate_csv(filename: str,
+                 rows: int,
+                 taxi_type: str = None,
+                 year: int = 2021,
+                 month: int = 1,
+                 seed: int = 0,
+                 chunksize: int = 100000) -> int:
+    """
+    Writes rows of a taxi type with pickups in year and month,
+    taxi type defaults to the one of filename.
+    Returns csv size in bytes
+    """
+    taxi_type = taxi_type or schema.get_taxi_type(filename)
+    fields = schema.get_taxi_schema(taxi_type).avro_schema()["fields"]
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(year=year, month=month, day=1)
+    seconds = int(
+        (start + pd.offsets.MonthBegin(1) - start).total_seconds()
+    )
+    with open(filename, "w", encoding="utf-8", newline="") as file:
+        for offset in range(0, rows, chunksize):
+            size = min(chunksize, rows - offset)
+            pickup = pd.Series(
+                start + pd.to_timedelta(
+                    rng.integers(0, seconds, size), unit="s"
+                )
+            )
+            pd.DataFrame({
+                field["name"]: generate_column(field, size, pickup, rng)
+                for field in fields
+            }).to_csv(file, index=False, header=not offset)
+        return file.tell()
+
+
+if __name__ == "__main__":
+    generate_csv(sys.argv[1], int(sys.argv[2]))
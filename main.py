@@ -12,37 +12,18 @@ The app will:
 4.3) Day of week with the lowest number of single rider trips
 """
 
-from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, avg
-from app import scrapper, converter
+from app import scrapper, converter, pipeline
+from app import queries as app_queries
+from app.config import PIPELINED
+from app.metrics import METRICS
 
 
 def queries() -> None:
     """
     Quering Examples Function
     """
-    # Quering example
-    spark = SparkSession.builder.appName("Application name").enableHiveSupport().getOrCreate()
-    data = spark.read.parquet("./records/2021/green_tripdata_2021-01.parquet")
-
-    # average trip distance
-    data.select("trip_distance").agg(avg(col("trip_distance"))).show()
-
-    # Busiest hours
-    data.createOrReplaceTempView("parquetFile")
-    spark.sql(
-        "SELECT hour(timestamp(lpep_pickup_datetime)) AS hour,"
-        " COUNT(*) as occurance FROM parquetFile"
-        " GROUP BY hour ORDER BY occurance DESC LIMIT 3"
-    ).show()
-
-    # Day of week with the lowest number of single rider trips
-    spark.sql(
-        "SELECT dayofweek(timestamp(lpep_pickup_datetime)) AS day,"
-        " COUNT(*) as occurance FROM parquetFile"
-        " WHERE passenger_count = 1 GROUP BY day"
-        " ORDER BY occurance ASC LIMIT 1"
-    ).show()
+    # Quering example: all converted green taxi records of 2021
+    app_queries.run(2021, 2021, "green")
 
 
 def app() -> None:
@@ -54,9 +35,17 @@ def app() -> None:
 
     # Data pipeline
     # Bypass - to download only 1 smallest file for example
-    scrapper.run(bypass=True)
-    converter.run()
-    queries()
+    if PIPELINED:
+        # Downloads, conversions and queries overlap
+        pipeline.run(
+            bypass=True,
+            queries=app_queries.get_queries(2021, 2021, "green"),
+        )
+    else:
+        scrapper.run(bypass=True)
+        converter.run()
+        queries()
+    print(f"\nMetrics: {METRICS.export()}, {METRICS.log_path}")
     print("\nExiting application")
 
 
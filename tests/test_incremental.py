@@ -0,0 +1,124 @@
+"""
+Incremental download states against a local HTTP stand-in:
+unchanged files are skipped, changed and unfinished ones downloaded
+"""
+import os
+import pytest
+from app import scrapper
+from app.catalog import Catalog
+from app.logger import Logger
+from app.scrapper import Downloader
+from app.utils import Progress
+from benchmarks.http_server import serve
+
+NAME = "green_tripdata_2021-01.csv"
+FILENAME = os.path.join(".", "records", "2021", NAME)
+CONVERTED = FILENAME.replace(".csv", ".parquet")
+
+
+class Interrupted(Exception):
+    """
+    Download stopped after its first chunk
+    """
+
+
+class InterruptingProgress(Progress):
+    """
+    Progress raising once the first chunk is written
+    """
+
+    def update(self, length_bytes: int) -> None:
+        raise Interrupted()
+
+
+def publish(folder: str, content: bytes, mtime: int) -> None:
+    """
+    Puts a new version of the remote file
+    """
+    path = os.path.join(folder, NAME)
+    with open(path, "wb") as file:
+        file.write(content)
+    os.utime(path, (mtime, mtime))
+
+
+def convert() -> None:
+    """
+    Stands in for Converter: csv is replaced by its parquet
+    """
+    os.replace(FILENAME, CONVERTED)
+    Logger(FILENAME).record_file_type("parquet")
+
+
+@pytest.fixture(name="link")
+def fixture_link(tmp_path, monkeypatch):
+    """
+    Link of a served file with a converted first version
+    """
+    monkeypatch.chdir(tmp_path)
+    site = tmp_path / "site"
+    site.mkdir()
+    publish(site, b"a" * 1000000, 1600000000)
+    with serve(str(site)) as url:
+        link = url + NAME
+        Downloader.download_link(link, 2021, incremental=True)
+        convert()
+        yield link, str(site)
+
+
+def test_not_modified_file_is_skipped(link, monkeypatch):
+    """
+    304 keeps converted file and records revalidation
+    """
+    link, _ = link
+    monkeypatch.setattr(scrapper, "REVALIDATE_AFTER", 0)
+    checked = Catalog.shared().get_source(link)["checked"]
+    Downloader.download_link(link, 2021, incremental=True)
+    assert not os.path.exists(FILENAME)
+    assert Logger(FILENAME).get_file_format() == "parquet"
+    assert Catalog.shared().get_source(link)["checked"] >= checked
+
+
+def test_recently_revalidated_file_is_skipped(link):
+    """
+    No request is made before REVALIDATE_AFTER
+    """
+    link, site = link
+    publish(site, b"b" * 1000000, 1700000000)
+    Downloader.download_link(link, 2021, incremental=True)
+    assert not os.path.exists(FILENAME)
+
+
+def test_modified_file_is_downloaded(link, monkeypatch):
+    """
+    200 downloads the new version
+    """
+    link, site = link
+    monkeypatch.setattr(scrapper, "REVALIDATE_AFTER", 0)
+    publish(site, b"b" * 1200000, 1700000000)
+    Downloader.download_link(link, 2021, incremental=True)
+    with open(FILENAME, "rb") as file:
+        assert file.read() == b"b" * 1200000
+    source = Catalog.shared().get_source(link)
+    assert source["size"] == 1200000
+    assert not source["pending"]
+
+
+def test_interrupted_download_is_retried(link, monkeypatch):
+    """
+    Validators of an unfinished download are pending,
+    next run downloads the file instead of a 304
+    """
+    link, site = link
+    monkeypatch.setattr(scrapper, "REVALIDATE_AFTER", 0)
+    publish(site, b"b" * 1200000, 1700000000)
+    with pytest.raises(Interrupted):
+        Downloader.download_link(
+            link, 2021, progress=InterruptingProgress(), incremental=True
+        )
+    assert os.path.getsize(FILENAME) < 1200000
+    assert Catalog.shared().get_source(link)["pending"]
+    monkeypatch.setattr(scrapper, "REVALIDATE_AFTER", 24 * 60 * 60)
+    Downloader.download_link(link, 2021, incremental=True)
+    with open(FILENAME, "rb") as file:
+        assert file.read() == b"b" * 1200000
+    assert not Catalog.shared().get_source(link)["pending"]
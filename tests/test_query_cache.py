@@ -0,0 +1,166 @@
+"""
+Query cache: results of changed files are not served,
+least recently used results are evicted above max_bytes
+"""
+import os
+import pytest
+from app import query_cache
+from app.queries import Queries, cached
+from app.query_cache import QueryCache
+
+
+class Clock:
+    """
+    Strictly increasing time.time stand-in
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self) -> float:
+        """
+        Next timestamp
+        """
+        self.now += 1
+        return self.now
+
+
+class CountingQueries(Queries):
+    """
+    Queries over given files counting computed results
+    """
+
+    def __init__(self, files: list, cache: QueryCache):
+        super().__init__(2021, 2021, "green", cache=False)
+        self.files = files
+        self.cache = cache
+        self.calls = 0
+
+    def get_input_files(self) -> list:
+        """
+        Given files
+        """
+        return self.files
+
+    @cached("average")
+    def average_trip_distance(self) -> float:
+        """
+        Total size of files
+        """
+        self.calls += 1
+        return float(sum(os.path.getsize(file) for file in self.files))
+
+    def busiest_hours(self, limit: int = 3) -> list:
+        """
+        Not queried
+        """
+        return []
+
+    def lowest_single_rider_weekday(self) -> tuple:
+        """
+        Not queried
+        """
+        return None
+
+
+@pytest.fixture(name="cache")
+def fixture_cache(tmp_path, monkeypatch):
+    """
+    Empty cache with a deterministic clock
+    """
+    monkeypatch.setattr(query_cache, "time", Clock())
+    return QueryCache(str(tmp_path / "cache.sqlite3"), max_bytes=1024)
+
+
+@pytest.fixture(name="part")
+def fixture_part(tmp_path):
+    """
+    Input file of queries
+    """
+    path = tmp_path / "part-0.parquet"
+    path.write_bytes(b"a" * 10)
+    os.utime(path, ns=(1600000000 * 10 ** 9, 1600000000 * 10 ** 9))
+    return str(path)
+
+
+def test_unchanged_files_are_served_from_cache(cache, part):
+    """
+    Second query is a hit
+    """
+    queries = CountingQueries([part], cache)
+    assert queries.average_trip_distance() == 10.0
+    assert queries.average_trip_distance() == 10.0
+    assert queries.calls == 1
+
+
+def test_changed_size_invalidates_result(cache, part):
+    """
+    A file of another size is queried again
+    """
+    queries = CountingQueries([part], cache)
+    queries.average_trip_distance()
+    with open(part, "ab") as file:
+        file.write(b"b" * 5)
+    assert queries.average_trip_distance() == 15.0
+    assert queries.calls == 2
+
+
+def test_changed_mtime_invalidates_result(cache, part):
+    """
+    A rewritten file of the same size is queried again
+    """
+    queries = CountingQueries([part], cache)
+    first = cache.fingerprint([part])
+    queries.average_trip_distance()
+    os.utime(part, ns=(1700000000 * 10 ** 9, 1700000000 * 10 ** 9))
+    assert cache.fingerprint([part]) != first
+    queries.average_trip_distance()
+    assert queries.calls == 2
+
+
+def test_added_file_invalidates_result(cache, part, tmp_path):
+    """
+    A new input file is queried
+    """
+    queries = CountingQueries([part], cache)
+    queries.average_trip_distance()
+    other = tmp_path / "part-1.parquet"
+    other.write_bytes(b"c" * 20)
+    queries.files = [part, str(other)]
+    assert queries.average_trip_distance() == 30.0
+    assert queries.calls == 2
+
+
+def test_new_result_replaces_result_of_changed_files(cache, part):
+    """
+    Only the latest file version of a query is kept
+    """
+    old_key = cache.make_key("query", cache.fingerprint([part]))
+    cache.put(old_key, "query", 1)
+    os.utime(part, ns=(1700000000 * 10 ** 9, 1700000000 * 10 ** 9))
+    new_key = cache.make_key("query", cache.fingerprint([part]))
+    cache.put(new_key, "query", 2)
+    assert cache.get(old_key) is None
+    assert cache.get(new_key) == 2
+
+
+def test_least_recently_used_results_are_evicted(cache):
+    """
+    Results above max_bytes are removed from the least recently used
+    """
+    result = ["x" * 300]
+    for name in ["first", "second", "third"]:
+        cache.put(name, name, result)
+    assert cache.get("first") == result
+    cache.put("fourth", "fourth", result)
+    assert cache.get("second") is None
+    for name in ["first", "third", "fourth"]:
+        assert cache.get(name) == result
+
+
+def test_result_larger_than_max_bytes_is_not_kept(cache):
+    """
+    Eviction leaves the cache within max_bytes
+    """
+    cache.put("large", "large", "x" * 2048)
+    assert cache.get("large") is None
@@ -0,0 +1,121 @@
+"""
+Segmented downloads against a local HTTP stand-in:
+interrupted transfers resume from the segment manifest,
+servers ignoring Range get a single stream
+"""
+import json
+import os
+from http.server import SimpleHTTPRequestHandler
+import pytest
+import requests
+from app.scrapper import Downloader
+from benchmarks.http_server import RangeRequestHandler, serve
+
+NAME = "green_tripdata_2021-01.csv"
+FILENAME = os.path.join(".", "records", "2021", NAME)
+MANIFEST = FILENAME + ".segments"
+SIZE = 4 * 1024 * 1024
+SEGMENTS = 4
+
+
+class FailingRangeHandler(RangeRequestHandler):
+    """
+    Refuses ranges starting at failing_start
+    """
+
+    failing_start = None
+
+    def send_head(self):
+        """
+        403 for the failing range
+        """
+        if (self.failing_start is not None and self.headers.get(
+                "Range", ""
+        ).startswith(f"bytes={self.failing_start}-")):
+            self.send_error(403)
+            return None
+        return super().send_head()
+
+
+class NoRangeHandler(SimpleHTTPRequestHandler):
+    """
+    Static files handler answering every request with the whole file
+    """
+
+    def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+        """
+        Quiet server
+        """
+
+
+@pytest.fixture(name="content")
+def fixture_content(tmp_path, monkeypatch):
+    """
+    Served file content, work folder with a year folder
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "site").mkdir()
+    os.makedirs(os.path.dirname(FILENAME))
+    content = os.urandom(SIZE)
+    (tmp_path / "site" / NAME).write_bytes(content)
+    yield content
+    FailingRangeHandler.failing_start = None
+
+
+def read() -> bytes:
+    """
+    Downloaded file content
+    """
+    with open(FILENAME, "rb") as file:
+        return file.read()
+
+
+def test_interrupted_download_resumes_missing_segments(content):
+    """
+    Finished segments are kept, only the failed one is fetched again
+    """
+    failing_start = 2 * SIZE // SEGMENTS
+    FailingRangeHandler.failing_start = failing_start
+    with serve("site", FailingRangeHandler) as url:
+        with pytest.raises(requests.HTTPError):
+            Downloader.download_segmented(
+                url + NAME, FILENAME, SIZE, segments=SEGMENTS
+            )
+        with open(MANIFEST, "r", encoding="utf-8") as file:
+            segments = json.load(file)["segments"]
+        assert [start for start, _, done in segments if not done] == [
+            failing_start
+        ]
+        FailingRangeHandler.failing_start = None
+        Downloader.download_segmented(
+            url + NAME, FILENAME, SIZE, segments=SEGMENTS
+        )
+    assert not os.path.exists(MANIFEST)
+    assert read() == content
+
+
+def test_server_ignoring_range_gets_single_stream(content):
+    """
+    A partial file and its manifest are replaced by the whole file
+    """
+    with open(FILENAME, "wb") as file:
+        file.write(b"x" * (SIZE // 2))
+    with open(MANIFEST, "w", encoding="utf-8") as file:
+        json.dump({"length": SIZE, "segments": []}, file)
+    with serve("site", NoRangeHandler) as url:
+        Downloader.download_segmented(
+            url + NAME, FILENAME, SIZE, segments=SEGMENTS
+        )
+    assert not os.path.exists(MANIFEST)
+    assert read() == content
+
+
+def test_resume_of_server_ignoring_range_restarts(content):
+    """
+    A 200 answer to a resumed stream rewrites the file
+    """
+    with open(FILENAME, "wb") as file:
+        file.write(b"x" * (SIZE // 2))
+    with serve("site", NoRangeHandler) as url:
+        Downloader.download(url + NAME, FILENAME, SIZE)
+    assert read() == content